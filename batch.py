@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+from collections import Counter
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import zombierush as zr
+
+TUNABLES = ("ENEMY_BASE_HP", "ENEMY_BASE_SPEED", "ENEMY_SPAWN_INTERVAL", "ENEMY_SPAWN_ACCEL",
+            "ENEMY_SPAWN_MIN_INTERVAL", "ENEMY_DIFFICULTY_RAMP", "MAX_ENEMIES", "XP_PER_KILL",
+            "XP_TO_LEVEL_BASE", "XP_TO_LEVEL_MULT", "PLAYER_SPEED", "BASE_FIRE_COOLDOWN",
+            "BASE_PROJECTILE_SPEED", "BASE_PROJECTILE_DAMAGE")
+
+# upgrade-picking policies: (levelup options, rng) -> index
+def pick_first(options, rng):
+    return 0
+
+def pick_random(options, rng):
+    return rng.randrange(len(options))
+
+def priority_policy(*names):
+    def pick(options, rng):
+        for name in names:
+            for i, (opt, desc, func) in enumerate(options):
+                if opt == name:
+                    return i
+        return 0
+    return pick
+
+POLICIES = {
+    "first": pick_first,
+    "random": pick_random,
+    "offense": priority_policy("Damage Up", "Faster Fire", "More Orbs", "Pierce", "Spread Shot", "Proj Speed"),
+    "defense": priority_policy("Max HP+", "Speed Up", "Faster Fire", "Damage Up"),
+    "growth": priority_policy("XP Boost", "More Orbs", "Faster Fire", "Damage Up"),
+}
+
+class Bot:
+    # headless input source; subclasses decide movement and aim
+    def __init__(self, policy, rng):
+        self.policy = policy
+        self.rng = rng
+
+    def nearest(self, items, pos):
+        best = None
+        best_d = float("inf")
+        for o in items:
+            if not o.active: continue
+            d = (o.pos - pos).length_squared()
+            if d < best_d:
+                best, best_d = o, d
+        return best
+
+    def aim_at(self, game, target):
+        # screen-space aim, the same convention as the mouse
+        pl = game.player.pos
+        if target is None:
+            return (zr.SCREEN_W, zr.SCREEN_H / 2)
+        return (target.pos.x - pl.x + zr.SCREEN_W / 2, target.pos.y - pl.y + zr.SCREEN_H / 2)
+
+    def move(self, game):
+        return (0, 0)
+
+    def read(self, game):
+        pick = self.policy(game.levelup_options, self.rng) if game.show_levelup else None
+        target = self.nearest(game.enemies, game.player.pos)
+        return zr.InputState(self.move(game), False, self.aim_at(game, target), pick)
+
+class TurretBot(Bot):
+    # stands still and shoots the nearest enemy
+    pass
+
+class KiteBot(Bot):
+    # backs away from nearby enemies, otherwise walks to the nearest XP orb
+    THREAT = 220.0
+
+    def move(self, game):
+        pl = game.player.pos
+        push = zr.vec()
+        for e in game.enemies:
+            if not e.active: continue
+            d = pl - e.pos
+            dist2 = d.length_squared()
+            if 0 < dist2 < self.THREAT * self.THREAT:
+                push += d / dist2
+        if push.length_squared() > 0:
+            return tuple(push.normalize())
+        orb = self.nearest(game.xps, pl)
+        if orb is not None and orb.pos != pl:
+            return tuple((orb.pos - pl).normalize())
+        return (0, 0)
+
+BOTS = {"turret": TurretBot, "kite": KiteBot}
+
+def apply_overrides(overrides):
+    for name, value in overrides.items():
+        setattr(zr, name, value)
+
+def run_one(job):
+    rng = random.Random(job["seed"] ^ 0x5EED)
+    bot = BOTS[job["bot"]](POLICIES[job["policy"]], rng)
+    game, ticks, wall = zr.run_headless(job["max_ticks"], seed=job["seed"], array_store=job["arrays"],
+                                        input_source=bot, dt=1.0 / job["tick_rate"])
+    return {
+        "run": job["run"],
+        "seed": job["seed"],
+        "bot": job["bot"],
+        "policy": job["policy"],
+        "survival": round(game.elapsed, 3),
+        "died": game.game_over,
+        "kills": game.player.kills,
+        "level": game.player.level,
+        "upgrades": game.upgrade_log,
+        "ticks": ticks,
+        "wall": round(wall, 3),
+    }
+
+def percentile(vals, q):
+    vals = sorted(vals)
+    k = (len(vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(vals) - 1)
+    return vals[lo] + (vals[hi] - vals[lo]) * (k - lo)
+
+def summarize(results):
+    groups = {}
+    for r in results:
+        groups.setdefault((r["bot"], r["policy"]), []).append(r)
+    print(f"{'bot':<8} {'policy':<8} {'runs':>5} {'died':>5} {'surv p10':>9} {'p50':>7} {'p90':>7} "
+          f"{'mean':>7} {'kills':>7} {'level':>6}")
+    for (bot, policy), rs in sorted(groups.items()):
+        surv = [r["survival"] for r in rs]
+        print(f"{bot:<8} {policy:<8} {len(rs):>5} {sum(r['died'] for r in rs):>5} "
+              f"{percentile(surv, 0.1):>9.1f} {percentile(surv, 0.5):>7.1f} {percentile(surv, 0.9):>7.1f} "
+              f"{sum(surv) / len(surv):>7.1f} {sum(r['kills'] for r in rs) / len(rs):>7.1f} "
+              f"{sum(r['level'] for r in rs) / len(rs):>6.2f}")
+    picks = Counter(name for r in results for name in r["upgrades"])
+    total = sum(picks.values())
+    if total:
+        print("upgrade picks: " + ", ".join(f"{name} {100.0 * n / total:.0f}%" for name, n in picks.most_common()))
+
+def parse_override(text):
+    name, _, value = text.partition("=")
+    if name not in TUNABLES or not value:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE with NAME one of {', '.join(TUNABLES)}")
+    try:
+        num = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{name}: {value!r} is not a number")
+    if isinstance(getattr(zr, name), int):
+        if not num.is_integer():
+            raise argparse.ArgumentTypeError(f"{name} is a whole number, got {value}")
+        return name, int(num)
+    return name, num
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="run many headless zombierush games in parallel")
+    ap.add_argument("--runs", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--bot", nargs="+", default=["kite"], choices=list(BOTS))
+    ap.add_argument("--policy", nargs="+", default=["random"], choices=list(POLICIES))
+    ap.add_argument("--minutes", type=float, default=10.0, help="stop each run after this much game time")
+    ap.add_argument("--tick-rate", type=int, default=zr.TICK_RATE)
+    ap.add_argument("--seed", type=int, default=0, help="first run seed; run i uses seed + i")
+    ap.add_argument("--arrays", action="store_true", help="use the NumPy entity store")
+    ap.add_argument("--set", dest="overrides", action="append", type=parse_override, default=[],
+                    metavar="NAME=VALUE", help="override a balance constant, e.g. XP_TO_LEVEL_BASE=40")
+    ap.add_argument("--out", default="batch.jsonl", help="per-run results, one JSON object per line")
+    args = ap.parse_args(argv)
+
+    overrides = dict(args.overrides)
+    combos = [(b, p) for b in args.bot for p in args.policy]
+    jobs = []
+    for i in range(args.runs):
+        bot, policy = combos[i % len(combos)]
+        jobs.append({"run": i, "seed": args.seed + i, "bot": bot, "policy": policy, "arrays": args.arrays,
+                     "tick_rate": args.tick_rate, "max_ticks": int(args.minutes * 60 * args.tick_rate)})
+
+    results = []
+    t0 = time.perf_counter()
+    chunk = max(1, min(16, args.runs // (args.workers * 8)))
+    with open(args.out, "w") as out, \
+            multiprocessing.Pool(args.workers, initializer=apply_overrides, initargs=(overrides,)) as pool:
+        for r in pool.imap_unordered(run_one, jobs, chunksize=chunk):
+            results.append(r)
+            out.write(json.dumps(r) + "\n")
+            out.flush()
+            if len(results) % max(1, args.runs // 20) == 0:
+                print(f"\r{len(results)}/{args.runs} runs", end="", file=sys.stderr, flush=True)
+    wall = time.perf_counter() - t0
+    print(file=sys.stderr)
+
+    ticks = sum(r["ticks"] for r in results)
+    print(f"{len(results)} runs on {args.workers} workers in {wall:.1f}s "
+          f"({len(results) / wall:.1f} runs/s, {ticks / wall:.0f} ticks/s), results in {args.out}")
+    if overrides:
+        print("overrides: " + ", ".join(f"{k}={v}" for k, v in overrides.items()))
+    summarize(results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,527 @@
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import json
+import platform
+import subprocess
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import zombierush as zr
+
+ENEMY_DENSITY = 220 / (1200.0 * 1200.0)
+
+def brute_swept_hit(p, e, fresh):
+    # time along p's move at which it enters e, or None; vector form of the test in resolve_projectile_hits
+    s = p.prev - e.prev
+    m = (p.pos - e.pos) - s
+    r = p.radius + e.radius
+    if s.length() <= r:
+        return 0.0 if fresh else None
+    a = m.dot(m)
+    b = 2 * s.dot(m)
+    c = s.dot(s) - r * r
+    disc = b * b - 4 * a * c
+    if a == 0 or b >= 0 or disc < 0:
+        return None
+    t = (-b - math.sqrt(disc)) / (2 * a)
+    return t if t <= 1 else None
+
+def brute_projectile_hits(game, dt=0.0):
+    # O(P*E) reference for Game.resolve_projectile_hits
+    for p in list(game.projectiles):
+        if not p.active: continue
+        fresh = p.max_life - p.life <= dt * 1.5
+        hits = []
+        for i, e in enumerate(game.enemies):
+            if not e.active: continue
+            t = brute_swept_hit(p, e, fresh)
+            if t is not None:
+                hits.append((t, i))
+        for t, i in sorted(hits):
+            e = game.enemies[i]
+            e.hp -= p.damage
+            if getattr(p, "pierce", 0) <= 0:
+                p.active = False
+            else:
+                p.pierce = getattr(p, "pierce", 0) - 1
+            if e.hp <= 0:
+                e.active = False
+                game.player.kills += 1
+                game.spawn_xp(e.pos, value=e.xp)
+            if not p.active:
+                break
+
+def collision_scene(n_enemies, n_projectiles, seed):
+    rng = random.Random(seed)
+    half = math.sqrt(n_enemies / ENEMY_DENSITY) / 2
+    game = zr.Game()
+    for _ in range(n_enemies):
+        e = game.enemy_pool.acquire(pos=(rng.uniform(-half, half), rng.uniform(-half, half)),
+                                    hp=rng.randint(3, 12), radius=12)
+        game.enemies.append(e)
+    for _ in range(n_projectiles):
+        p = game.projectile_pool.acquire(pos=(rng.uniform(-half, half), rng.uniform(-half, half)),
+                                         direction=(1, 0), speed=320, damage=6)
+        p.pierce = rng.randint(0, 2)
+        game.projectiles.append(p)
+    return game
+
+def scene_state(game):
+    return ([(e.hp, e.active) for e in game.enemies],
+            [(p.active, p.pierce) for p in game.projectiles],
+            [(x.pos.x, x.pos.y, x.value) for x in game.xps],
+            game.player.kills)
+
+def bench_collisions(args):
+    counts = [220, 500, 1000, 2000, 5000]
+    print(f"{'enemies':>8} {'brute ms':>10} {'rebuild ms':>11} {'query ms':>9} {'us/proj':>8}  match")
+    ok = True
+    for n in counts:
+        ref = collision_scene(n, args.projectiles, args.seed)
+        t0 = time.perf_counter()
+        brute_projectile_hits(ref)
+        t_brute = time.perf_counter() - t0
+
+        game = collision_scene(n, args.projectiles, args.seed)
+        t_rebuild = t_query = 0.0
+        for _ in range(args.repeat):
+            trial = collision_scene(n, args.projectiles, args.seed) if _ else game
+            t0 = time.perf_counter()
+            trial.enemy_grid.rebuild(trial.enemies)
+            t1 = time.perf_counter()
+            trial.resolve_projectile_hits()
+            t2 = time.perf_counter()
+            t_rebuild += t1 - t0
+            t_query += t2 - t1
+        t_rebuild /= args.repeat
+        t_query /= args.repeat
+
+        match = scene_state(game) == scene_state(ref)
+        ok = ok and match
+        print(f"{n:>8} {t_brute*1000:>10.2f} {t_rebuild*1000:>11.2f} {t_query*1000:>9.2f} "
+              f"{t_query*1e6/args.projectiles:>8.2f}  {'yes' if match else 'NO'}")
+    return 0 if ok else 1
+
+def contact_within(p, e, duration):
+    # whether p and e, both moving in straight lines, come within reach of each other by duration
+    s = p.pos - e.pos
+    v = p.vel - e.vel
+    t = min(max(-s.dot(v) / v.dot(v), 0.0), duration)
+    return (s + v * t).length() < p.radius + e.radius
+
+def tunneling_scene(speed, enemy_speed, duration, seed, n_enemies=150, n_projectiles=100):
+    # a band of unkillable enemies drifting in straight lines at enemy_speed, crossed left to right
+    # by piercing shots; returns the game and how many (shot, enemy) pairs touch within duration
+    rng = random.Random(seed)
+    game = zr.Game()
+    for _ in range(n_enemies):
+        e = game.enemy_pool.acquire(pos=(rng.uniform(0, 1400), rng.uniform(-200, 200)), hp=10**9, radius=12)
+        a = rng.uniform(0, math.tau)
+        e.vel.update(math.cos(a) * enemy_speed, math.sin(a) * enemy_speed)
+        game.enemies.append(e)
+    for _ in range(n_projectiles):
+        p = game.projectile_pool.acquire(pos=(-100, rng.uniform(-200, 200)), direction=(1, 0),
+                                         speed=speed, damage=1, life=duration * 2)
+        p.pierce = 10**9
+        game.projectiles.append(p)
+    expected = sum(contact_within(p, e, duration) for p in game.projectiles for e in game.enemies)
+    return game, expected
+
+def bench_tunneling(args):
+    # swept hits against a per-tick point test; swept must find every pair at every rate, for
+    # still enemies and for ones moving like a late-game runner
+    print(f"{'rate':>5} {'speed':>6} {'enemy':>6} {'expected':>9} {'swept':>6} {'point':>6}  tunneled")
+    ok = True
+    for mult in (1, 10):
+        speed = zr.BASE_PROJECTILE_SPEED * mult
+        # whole 1/30 s ticks, so every rate simulates the same span
+        duration = math.ceil(1700.0 / speed * 30) / 30
+        for enemy_speed in (0, 900):
+            for rate in (30, 60, 240):
+                dt = 1.0 / rate
+                game, expected = tunneling_scene(speed, enemy_speed, duration, args.seed)
+                grid = game.enemy_grid
+                seen = set()
+                for _ in range(round(duration * rate)):
+                    for e in game.enemies:
+                        e.prev.update(e.pos)
+                        e.pos.x += e.vel.x * dt
+                        e.pos.y += e.vel.y * dt
+                    grid.rebuild(game.enemies)
+                    for p in game.projectiles:
+                        p.update(dt)
+                        seen.update((id(p), id(e)) for e in grid.hits(p.pos, p.radius))
+                    game.resolve_projectile_hits(dt)
+                swept = sum(10**9 - e.hp for e in game.enemies)
+                ok = ok and swept == expected
+                print(f"{rate:>5} {mult:>5}x {enemy_speed:>6} {expected:>9} {swept:>6} {len(seen):>6}  "
+                      f"{expected - swept}")
+    return 0 if ok else 1
+
+def bench_spawns(args):
+    # the spawn schedule alone, into a crowd that never moves or dies: what spawns must not depend
+    # on the tick rate, down to one tick covering the whole run
+    seconds = args.minutes * 60.0
+    print(f"{'rate':>6} {'ticks':>7} {'spawned':>8} {'total hp':>9} {'by radius':<24} {'ms':>8}")
+    results = []
+    for rate in (30, 60, 240, 0):
+        game = zr.Game(seed=args.seed)
+        sp = game.spawn
+        sp.max_enemies = 10**9
+        ticks = int(round(seconds * rate)) if rate else 1
+        dt = 1.0 / rate if rate else seconds
+        t0 = time.perf_counter()
+        for _ in range(ticks):
+            sp.update(dt, game)
+        wall = time.perf_counter() - t0
+        radii = {}
+        for e in game.enemies:
+            radii[e.radius] = radii.get(e.radius, 0) + 1
+        by_radius = " ".join(f"{r}:{n}" for r, n in sorted(radii.items()))
+        hp = sum(e.max_hp for e in game.enemies)
+        results.append((sp.spawned, sp.dropped, hp, by_radius))
+        print(f"{rate or 'once':>6} {ticks:>7} {sp.spawned:>8} {hp:>9} {by_radius:<24} {wall*1000:>8.1f}")
+    ok = len(set(results)) == 1
+    print("identical at every rate" if ok else "MISMATCH between rates")
+    return 0 if ok else 1
+
+def list_remove_sweep(pool, items):
+    # the per-object copy-and-remove loop Game.update used before compaction
+    for o in list(items):
+        if not o.active:
+            pool.release(o)
+            items.remove(o)
+
+def removal_scene(n_enemies, seed):
+    rng = random.Random(seed)
+    game = zr.Game()
+    for _ in range(n_enemies):
+        e = game.enemy_pool.acquire(pos=(rng.uniform(-600, 600), rng.uniform(-600, 600)), radius=12)
+        game.enemies.append(e)
+    return game, rng
+
+def bench_removal(args):
+    counts = [220, 1000, 5000, 10000]
+    print(f"{'enemies':>8} {'killed':>7} {'list.remove ms':>15} {'compact ms':>11}  match")
+    ok = True
+    for n in counts:
+        times = []
+        survivors = []
+        for sweep in (list_remove_sweep, lambda pool, items: pool.compact(items)):
+            total = 0.0
+            for _ in range(args.repeat):
+                game, rng = removal_scene(n, args.seed)
+                for e in rng.sample(game.enemies, min(args.kills, n)):
+                    e.active = False
+                t0 = time.perf_counter()
+                sweep(game.enemy_pool, game.enemies)
+                total += time.perf_counter() - t0
+            times.append(total / args.repeat)
+            survivors.append([(e.pos.x, e.pos.y) for e in game.enemies])
+        match = survivors[0] == survivors[1]
+        ok = ok and match
+        print(f"{n:>8} {min(args.kills, n):>7} {times[0]*1000:>15.3f} {times[1]*1000:>11.3f}  {'yes' if match else 'NO'}")
+    return 0 if ok else 1
+
+SCENARIOS = {
+    "idle": dict(enemies=0, max_enemies=0),
+    "enemies_220": dict(enemies=220),
+    "enemies_2k": dict(enemies=2000),
+    "enemies_10k": dict(enemies=10000),
+    "heavy_build": dict(enemies=220, upgrades={"More Orbs": 4, "Spread Shot": 4, "Pierce": 3,
+                                               "Faster Fire": 5, "Damage Up": 2}),
+    "xp_flood": dict(enemies=220, xps=2000),
+    "obstacles_2k": dict(enemies=2000, obstacles=120),
+}
+
+PHASES = ["player", "spawn", "projectiles", "enemies", "collision", "xp", "effects", "draw", "frame"]
+
+class OrbitInput:
+    # walks a slow circle and sweeps the aim around it; always takes the first upgrade
+    def __init__(self):
+        self.tick = 0
+
+    def read(self, game):
+        self.tick += 1
+        a = self.tick / 120.0
+        b = self.tick / 20.0
+        aim = (zr.SCREEN_W / 2 + 200 * math.cos(b), zr.SCREEN_H / 2 + 200 * math.sin(b))
+        return zr.InputState(move=(math.cos(a), math.sin(a)), aim=aim, pick=0, sampled=time.perf_counter())
+
+def build_scenario(spec, seed, array_store, lod=True):
+    rng = random.Random(seed)
+    obstacles = zr.scatter_obstacles(spec.get("obstacles", 0), rng)
+    game = zr.Game(array_store=array_store, seed=seed, input_source=OrbitInput(), obstacles=obstacles, lod=lod)
+    game.prof = zr.Profiler()
+    if "state" in spec:
+        # a prepared snapshot instead of a synthetic crowd
+        with open(spec["state"], "rb") as f:
+            game.restore(f.read())
+        game.player.max_hp = game.player.hp = 10 ** 9
+        return game
+    pl = game.player
+    pl.max_hp = pl.hp = 10 ** 9
+    n = spec.get("enemies", 0)
+    game.spawn.max_enemies = spec.get("max_enemies", max(n, zr.MAX_ENEMIES))
+    for _ in range(n):
+        a = rng.uniform(0, 2 * math.pi)
+        r = rng.uniform(350, 350 + 40 * math.sqrt(n))
+        e = game.enemy_pool.acquire(pos=(r * math.cos(a), r * math.sin(a)),
+                                    hp=zr.ENEMY_BASE_HP, speed=zr.ENEMY_BASE_SPEED, radius=12)
+        game.enemies.append(e)
+    # straight from the pool: spawn_xp() would stack these onto XP_MAX_LIVE orbs
+    for _ in range(spec.get("xps", 0)):
+        game.xp_pool.spawn(game.xps, pos=(rng.uniform(-600, 600), rng.uniform(-600, 600)), value=zr.XP_PER_KILL)
+    upgrades = {name: func for name, desc, func in zr.UPGRADES}
+    for name, count in spec.get("upgrades", {}).items():
+        for _ in range(count):
+            upgrades[name](pl)
+    return game
+
+def percentile(vals, q):
+    vals = sorted(vals)
+    if not vals:
+        return 0.0
+    k = (len(vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(vals) - 1)
+    return vals[lo] + (vals[hi] - vals[lo]) * (k - lo)
+
+def run_scenario(name, spec, args):
+    game = build_scenario(spec, args.seed, args.arrays, not args.no_lod)
+    surf = zr.screen if not args.no_draw else None
+    samples = {ph: [] for ph in PHASES}
+    for tick in range(args.warmup + args.ticks):
+        t0 = time.perf_counter()
+        game.update(1.0 / zr.FPS, [])
+        if surf is not None:
+            game.draw(surf)
+        frame = time.perf_counter() - t0
+        phases = game.prof.take()
+        if tick < args.warmup:
+            continue
+        phases["frame"] = frame
+        for ph in PHASES:
+            samples[ph].append(phases.get(ph, 0.0) * 1000.0)
+    stats = {}
+    for ph, vals in samples.items():
+        # particles, like the ground, only exist once something has been drawn
+        if ph in ("effects", "draw") and surf is None:
+            continue
+        stats[ph] = {"p50": percentile(vals, 0.5), "p90": percentile(vals, 0.9),
+                     "p99": percentile(vals, 0.99), "max": max(vals), "mean": sum(vals) / len(vals)}
+    return {"ms": stats, "enemies": len(game.enemies), "projectiles": len(game.projectiles),
+            "xps": len(game.xps), "kills": game.player.kills}
+
+def bench_allocs(args):
+    # tracemalloc high-water above each tick's starting footprint; temporaries that outlive
+    # a single statement (lists, copies, rebuilt buckets) show up here
+    game = build_scenario(dict(enemies=args.enemies), args.seed, False)
+    game.prof = zr.NullProfiler()
+    tracemalloc.start()
+    for _ in range(args.warmup):
+        game.update(1.0 / zr.FPS, [])
+    start = tracemalloc.get_traced_memory()[0]
+    peaks = []
+    for _ in range(args.ticks):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        game.update(1.0 / zr.FPS, [])
+        cur, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    tracemalloc.stop()
+    worst = max(peaks)
+    print(f"{len(game.enemies)} enemies, {args.ticks} ticks")
+    print(f"  transient bytes/tick  p50 {percentile(peaks, 0.5):.0f}  p99 {percentile(peaks, 0.99):.0f}  max {worst}")
+    print(f"  retained bytes/tick   {(cur - start) / args.ticks:.1f}")
+    ok = worst <= args.budget
+    print(f"  budget {args.budget} bytes/tick: {'ok' if ok else 'EXCEEDED'}")
+    return 0 if ok else 1
+
+def bench_replays(args):
+    # recorded sessions as fixtures: per-phase timings, plus the final digest as a regression check
+    ok = True
+    for path in args.files:
+        replay = zr.Replay.load(path)
+        prof = zr.Profiler(history=1 << 20)
+        game, n, wall, expected = zr.run_replay(replay, prof=prof)
+        match = expected is None or game.digest() == expected
+        ok = ok and match
+        print(f"{path}  ({n} ticks, {n / max(wall, 1e-9):.0f} ticks/s, "
+              f"{'digest matches' if match else 'DIGEST MISMATCH'})")
+        print(f"  {'phase':<12} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for ph in PHASES:
+            if ph == "draw":
+                continue
+            if ph == "frame":
+                vals = [sum(phases.values()) * 1000.0 for phases, counts in prof.frames]
+            else:
+                vals = [phases.get(ph, 0.0) * 1000.0 for phases, counts in prof.frames]
+            print(f"  {ph:<12} {percentile(vals, 0.5):>8.3f} {percentile(vals, 0.9):>8.3f} "
+                  f"{percentile(vals, 0.99):>8.3f} {max(vals, default=0.0):>8.3f}")
+    return 0 if ok else 1
+
+def bench_prepare(args):
+    # simulate once up to a late-game moment and save it, so scenarios can start there
+    game = build_scenario(dict(enemies=0, max_enemies=args.enemies), args.seed, args.arrays)
+    game.prof = zr.NullProfiler()
+    ticks = int(args.minutes * 60 * zr.TICK_RATE)
+    t0 = time.perf_counter()
+    for _ in range(ticks):
+        game.update(1.0 / zr.TICK_RATE, [])
+    wall = time.perf_counter() - t0
+    data = game.snapshot()
+    with open(args.out, "wb") as f:
+        f.write(data)
+    print(f"simulated {ticks} ticks in {wall:.1f}s: {len(game.enemies)} enemies, {len(game.projectiles)} projectiles, "
+          f"{len(game.xps)} xp, level {game.player.level}; wrote {len(data)} bytes to {args.out}")
+    t0 = time.perf_counter()
+    game.restore(data)
+    print(f"restoring it takes {(time.perf_counter() - t0) * 1000:.2f} ms")
+    return 0
+
+def bench_pipeline(args):
+    # the same scenario through the serial main loop and the --threaded one, on the real
+    # display path; the sim thread gets whatever the main thread leaves it
+    spec = SCENARIOS[args.scenario]
+    zr.init_display()
+    results = {}
+    for name, loop in (("serial", zr.play), ("threaded", zr.play_threaded)):
+        game = build_scenario(spec, args.seed, args.arrays)
+        game.prof = zr.NullProfiler()
+        game.player.xp_to_next = 10 ** 9  # no level-up menu stalling either loop
+        stats = zr.FrameStats()
+        t0 = time.perf_counter()
+        loop(game, args.fps, zr.TICK_RATE, zr.MAX_SUBSTEPS, frames=args.frames, stats=stats)
+        wall = time.perf_counter() - t0
+        results[name] = stats.summary()
+        print(f"{name}  ({args.frames} frames in {wall:.1f}s, simulated {game.elapsed / wall:.2f}x real time, "
+              f"{len(game.enemies)} enemies)")
+        print(f"  {'':<15} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for what, st in results[name].items():
+            print(f"  {what:<15} {st['p50']:>8.3f} {st['p90']:>8.3f} {st['p99']:>8.3f} {st['max']:>8.3f}")
+    return 0
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_scenarios(args):
+    scenarios = dict(SCENARIOS)
+    for path in args.state:
+        scenarios[os.path.basename(path)] = dict(state=path)
+    names = args.only or ([os.path.basename(p) for p in args.state] if args.state else list(SCENARIOS))
+    unknown = [n for n in names if n not in scenarios]
+    if unknown:
+        print(f"unknown scenario(s): {', '.join(unknown)}")
+        return 2
+    if not args.no_draw:
+        zr.init_display()
+    results = {}
+    for name in names:
+        res = run_scenario(name, scenarios[name], args)
+        results[name] = res
+        print(f"{name}  ({res['enemies']} enemies, {res['projectiles']} projectiles, {res['xps']} xp)")
+        print(f"  {'phase':<12} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+        for ph, st in res["ms"].items():
+            print(f"  {ph:<12} {st['p50']:>8.3f} {st['p90']:>8.3f} {st['p99']:>8.3f} {st['max']:>8.3f}")
+    if args.out:
+        report = {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pygame": zr.pygame.version.ver,
+            "array_store": bool(args.arrays),
+            "draw": not args.no_draw,
+            "lod": not args.no_lod,
+            "ticks": args.ticks,
+            "seed": args.seed,
+            "scenarios": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out}")
+    return 0
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="zombierush benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("collisions", help="spatial hash vs brute-force projectile hits")
+    c.add_argument("--projectiles", type=int, default=200)
+    c.add_argument("--repeat", type=int, default=5)
+    c.add_argument("--seed", type=int, default=1)
+    c.set_defaults(func=bench_collisions)
+
+    t = sub.add_parser("tunneling", help="swept projectile hits at high speed and low tick rates")
+    t.add_argument("--seed", type=int, default=1)
+    t.set_defaults(func=bench_tunneling)
+
+    sp = sub.add_parser("spawns", help="spawn schedule counts at 30, 60 and 240 Hz and in one long tick")
+    sp.add_argument("--minutes", type=float, default=10.0)
+    sp.add_argument("--seed", type=int, default=1)
+    sp.set_defaults(func=bench_spawns)
+
+    r = sub.add_parser("removal", help="per-frame compaction vs list.remove when many enemies die at once")
+    r.add_argument("--kills", type=int, default=200)
+    r.add_argument("--repeat", type=int, default=5)
+    r.add_argument("--seed", type=int, default=1)
+    r.set_defaults(func=bench_removal)
+
+    sc = sub.add_parser("scenarios", help="per-phase update/draw timings for scripted scenarios")
+    sc.add_argument("only", nargs="*", metavar="scenario",
+                    help="scenarios to run (default: all of %s)" % ", ".join(SCENARIOS))
+    sc.add_argument("--ticks", type=int, default=600)
+    sc.add_argument("--warmup", type=int, default=60)
+    sc.add_argument("--seed", type=int, default=1)
+    sc.add_argument("--arrays", action="store_true", help="use the NumPy entity store")
+    sc.add_argument("--no-draw", action="store_true", help="skip Game.draw")
+    sc.add_argument("--no-lod", action="store_true", help="simulate far enemies at full detail")
+    sc.add_argument("--out", help="write results as JSON")
+    sc.add_argument("--state", action="append", default=[], metavar="PATH",
+                    help="also run a scenario starting from a snapshot written by 'prepare'")
+    sc.set_defaults(func=bench_scenarios)
+
+    pr = sub.add_parser("prepare", help="simulate to a late-game state and save it as a snapshot")
+    pr.add_argument("--minutes", type=float, default=10.0)
+    pr.add_argument("--enemies", type=int, default=zr.MAX_ENEMIES, help="enemy cap while simulating")
+    pr.add_argument("--seed", type=int, default=1)
+    pr.add_argument("--arrays", action="store_true", help="use the NumPy entity store")
+    pr.add_argument("--out", default="minute10.zrs")
+    pr.set_defaults(func=bench_prepare)
+
+    rp = sub.add_parser("replay", help="replay recorded sessions, timing each phase and checking digests")
+    rp.add_argument("files", nargs="+", metavar="replay")
+    rp.set_defaults(func=bench_replays)
+
+    pl = sub.add_parser("pipeline", help="frame time and input latency, serial loop vs --threaded")
+    pl.add_argument("scenario", nargs="?", default="enemies_2k", choices=list(SCENARIOS))
+    pl.add_argument("--frames", type=int, default=600)
+    pl.add_argument("--fps", type=int, default=zr.FPS, help="frame cap for both loops (0 for none)")
+    pl.add_argument("--seed", type=int, default=1)
+    pl.add_argument("--arrays", action="store_true", help="use the NumPy entity store")
+    pl.set_defaults(func=bench_pipeline)
+
+    al = sub.add_parser("allocs", help="per-tick allocation high-water against a budget")
+    al.add_argument("--enemies", type=int, default=500)
+    al.add_argument("--ticks", type=int, default=600)
+    al.add_argument("--warmup", type=int, default=300)
+    al.add_argument("--budget", type=int, default=4096, help="max transient bytes per tick")
+    al.add_argument("--seed", type=int, default=1)
+    al.set_defaults(func=bench_allocs)
+
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
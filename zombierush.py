@@ -1,11 +1,32 @@
+import time
+STARTUP_T0 = time.perf_counter()  # taken before importing pygame so the startup report covers it
+
+import os
 import pygame
 import random
 import math
 import sys
-from collections import deque
+import struct
+import hashlib
+import argparse
+import csv
+import heapq
+import json
+import bisect
+import queue
+import threading
+from array import array
+from collections import deque, OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 SCREEN_W, SCREEN_H = 960, 640
 FPS = 60
+TICK_RATE = 60
+MAX_SUBSTEPS = 5
 
 PLAYER_SPEED = 160
 PLAYER_SPRINT_MULT = 1.6
@@ -13,34 +34,187 @@ PLAYER_SPRINT_MULT = 1.6
 BASE_FIRE_COOLDOWN = 0.45 
 BASE_PROJECTILE_SPEED = 320
 BASE_PROJECTILE_DAMAGE = 6
+PROJECTILE_LIFE = 2.4
 
 ENEMY_BASE_HP = 6
 ENEMY_BASE_SPEED = 45
 ENEMY_SPAWN_INTERVAL = 1.0 
 ENEMY_SPAWN_ACCEL = 0.98  
+ENEMY_SPAWN_MIN_INTERVAL = 0.12
+ENEMY_DIFFICULTY_RAMP = 60.0
 
 MAX_ENEMIES = 220
+SPAWN_TABLE_HORIZON = 3600.0  # seconds of trickle spawn times worked out ahead; later ones keep the last spacing
+SPAWN_EPSILON = 1e-6  # slack when comparing spawn times against the summed tick clock
+SPAWN_BURST_RADIUS = 60
+SPAWN_RING_MARGIN = 40
+
+# hp and speed multipliers on top of the difficulty ramp, radius, xp and score multiplier
+ENEMY_TYPES = {
+    "walker": (1.0, 1.0, 12, 1),
+    "runner": (0.5, 1.8, 10, 1),
+    "brute": (5.0, 0.6, 18, 4),
+}
+TRICKLE_TYPE = "walker"
+# scheduled on top of the trickle: (first at, repeat every or 0, shape, count, enemy type). Shapes
+# are "edge" (each at a random screen edge), "burst" (a clump at one edge), "ring" (around the player)
+WAVES = (
+    (60.0, 60.0, "burst", 8, "runner"),
+    (120.0, 120.0, "ring", 20, "walker"),
+    (180.0, 90.0, "edge", 3, "brute"),
+)
+WAVE_SHAPES = ("edge", "burst", "ring")
 
 XP_PER_KILL = 8
 XP_TO_LEVEL_BASE = 30
+XP_TO_LEVEL_MULT = 1.35
+XP_LIFE = 12.0
+XP_MERGE_RADIUS = 26
+XP_MAX_LIVE = 80  # hard cap; drops past it stack onto a live orb
+XP_MAGNET_RADIUS = 90
+XP_MAGNET_SPEED = 360
 
 POOL_PROJECTILES = 120
 POOL_XP = 80
 POOL_ENEMIES = 220
+POOL_PROJECTILES_MAX = 600
+POOL_XP_MAX = None
+POOL_ENEMIES_MAX = None
+POOL_PROJECTILES_OVERFLOW = "recycle"
+POOL_XP_OVERFLOW = "grow"
+POOL_ENEMIES_OVERFLOW = "grow"
+
+SPATIAL_CELL = 64
+SPATIAL_MAX_CELLS = 16384
+WORLD_HALF = 2000  # obstacles are scattered inside this; the world itself is unbounded
+CHUNK_SIZE = 512
+CHUNK_CACHE = 20  # ground chunks kept, 1 MB each at 32 bpp
+CHUNK_LOOKAHEAD = 45  # ticks of player movement to generate ground ahead of
+PARTICLE_BUDGET = 4096
+PARTICLE_LIFE = 0.5
+PARTICLE_SPEED = 150
+PARTICLE_DRAG = 4.0
+PARTICLES_HIT = 4
+PARTICLES_KILL = 14
+PARTICLES_LEVELUP = 60
+FLOW_CELL = 32
+FLOW_RADIUS = 24
+FLOW_BUILD_STEPS = 400  # search steps per tick for a rebuild; the old field steers until it is done
+SEPARATION_NEIGHBOURS = 4
+SEPARATION_SPEED = 90
+# simulation level of detail: (distance from the player, tick interval) bands. Enemies past a
+# band's distance move only every interval ticks, by interval*dt and without jitter, and stay
+# out of the enemy grid; the first band sits beyond the view, and Game.lod_bands() pushes it out
+# past the player's projectile reach once Proj Speed upgrades take shots further
+LOD_BANDS = ((1000, 2), (1500, 4), (2200, 8))
+CULL_MARGIN = 24
+TEXT_CACHE_SIZE = 256
+CHAR_FRAME_SIZE = (32, 32)
+
+PROFILE_HISTORY = 600
+PROFILE_GRAPH_FRAMES = 240
+PROFILE_COLORS = {
+    "wait": (60, 60, 70),
+    "events": (150, 150, 150),
+    "player": (170, 200, 255),
+    "spawn": (120, 120, 255),
+    "projectiles": (255, 155, 60),
+    "enemies": (220, 90, 90),
+    "collision": (230, 210, 80),
+    "xp": (200, 240, 120),
+    "effects": (250, 240, 180),
+    "draw": (90, 200, 200),
+    "overlay": (110, 110, 130),
+    "flip": (200, 120, 220),
+}
 C_BG = (18, 18, 28)
 C_PLAYER = (170, 200, 255)
 C_PROJECTILE = (255, 155, 60)
 C_ENEMY = (220, 90, 90)
 C_XP = (200, 240, 120)
+C_OBSTACLE = (58, 60, 80)
+C_GROUND = ((22, 22, 34), (15, 15, 24), (27, 26, 38))  # ground speckles and patches over C_BG
+C_GROUND_LINE = (21, 21, 32)
+FX_HIT, FX_KILL, FX_LEVELUP = 0, 1, 2
+C_PARTICLES = (C_PROJECTILE, C_ENEMY, C_XP)  # by FX_ index
 C_UI = (210, 210, 230)
-
-pygame.init()
-screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
-clock = pygame.time.Clock()
-font = pygame.font.SysFont("consolas", 18)
-bigfont = pygame.font.SysFont("consolas", 36)
-
-CHAR_SHEET = pygame.image.load("character-sheet.png").convert_alpha()
+LAYER_COLORS = (C_XP, C_ENEMY, C_PROJECTILE)  # RenderSnapshot.layers order
+
+FONT_NAME = "consolas"
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "font.ttf")
+CHAR_SHEET_FILE = "character-sheet.png"
+QUICKSAVE_FILE = "quicksave.zrs"
+
+# display and fonts are only created by init_display(); the simulation runs without them
+screen = None
+clock = None
+font = None
+bigfont = None
+startup_times = {}
+
+def mark_startup(phase, t0):
+    startup_times[phase] = (time.perf_counter() - t0) * 1000.0
+    return time.perf_counter()
+
+def init_display():
+    # only the display and font modules; pygame.init() would also bring up audio and joysticks
+    global screen, clock, font, bigfont
+    t = time.perf_counter()
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    clock = pygame.time.Clock()
+    t = mark_startup("display", t)
+    font = get_font(18)
+    bigfont = get_font(36)
+    mark_startup("fonts", t)
+
+_font_path = None
+_fonts = {}
+
+def font_path():
+    # resolved once per process. A TTF in assets/ wins; otherwise the system lookup, except on
+    # Linux where SysFont shells out to fc-list to scan every installed font. There the pygame
+    # default font is used, which is what SysFont falls back to when consolas is missing anyway.
+    global _font_path
+    if _font_path is None:
+        if os.path.exists(FONT_FILE):
+            _font_path = FONT_FILE
+        elif sys.platform.startswith("linux"):
+            _font_path = ""
+        else:
+            _font_path = pygame.font.match_font(FONT_NAME) or ""
+    return _font_path or None
+
+def get_font(size):
+    f = _fonts.get(size)
+    if f is None:
+        f = _fonts[size] = pygame.font.Font(font_path(), size)
+    return f
+
+_char_frames = None
+
+def char_frames():
+    # the character sheet is loaded and sliced on first use, not at startup; [] if it is
+    # missing or smaller than one frame, and the player is drawn as a circle instead
+    global _char_frames
+    if _char_frames is None:
+        try:
+            sheet = pygame.image.load(CHAR_SHEET_FILE).convert_alpha()
+        except (pygame.error, FileNotFoundError):
+            _char_frames = []
+        else:
+            _char_frames = slice_sheet(sheet, CHAR_FRAME_SIZE)
+    return _char_frames
+
+def slice_sheet(sheet, size):
+    # cut a sprite sheet into standalone frame surfaces once, row by row
+    w, h = size
+    frames = []
+    for y in range(0, sheet.get_height() - h + 1, h):
+        for x in range(0, sheet.get_width() - w + 1, w):
+            frames.append(sheet.subsurface((x, y, w, h)).copy())
+    return frames
 
 def vec(x=0, y=0):
     return pygame.math.Vector2(x, y)
@@ -48,57 +222,976 @@ def vec(x=0, y=0):
 def clamp(n, a, b):
     return max(a, min(b, n))
 
-def rand_edge_pos(margin=30):
-    side = random.choice(['top', 'bottom', 'left', 'right'])
+def rand_edge_pos(margin=30, rng=random):
+    side = rng.choice(['top', 'bottom', 'left', 'right'])
     if side == 'top':
-        return vec(random.uniform(-margin, SCREEN_W + margin), -margin)
+        return vec(rng.uniform(-margin, SCREEN_W + margin), -margin)
     if side == 'bottom':
-        return vec(random.uniform(-margin, SCREEN_W + margin), SCREEN_H + margin)
+        return vec(rng.uniform(-margin, SCREEN_W + margin), SCREEN_H + margin)
     if side == 'left':
-        return vec(-margin, random.uniform(-margin, SCREEN_H + margin))
-    return vec(SCREEN_W + margin, random.uniform(-margin, SCREEN_H + margin))
+        return vec(-margin, rng.uniform(-margin, SCREEN_H + margin))
+    return vec(SCREEN_W + margin, rng.uniform(-margin, SCREEN_H + margin))
+
+class InputState:
+    # one tick of player input; aim is in screen coordinates like the mouse, sampled is the
+    # perf_counter() time live input was read at (for latency figures, 0 otherwise)
+    def __init__(self, move=(0, 0), sprint=False, aim=(SCREEN_W, SCREEN_H / 2), pick=None, sampled=0.0):
+        self.move = move
+        self.sprint = sprint
+        self.aim = aim
+        self.pick = pick
+        self.sampled = sampled
+
+class PygameInput:
+    def read(self, game):
+        keys = pygame.key.get_pressed()
+        dx = dy = 0
+        if keys[pygame.K_w] or keys[pygame.K_UP]: dy -= 1
+        if keys[pygame.K_s] or keys[pygame.K_DOWN]: dy += 1
+        if keys[pygame.K_a] or keys[pygame.K_LEFT]: dx -= 1
+        if keys[pygame.K_d] or keys[pygame.K_RIGHT]: dx += 1
+        sprint = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
+        return InputState((dx, dy), bool(sprint), pygame.mouse.get_pos(), sampled=time.perf_counter())
+
+class ScriptedInput:
+    # plays back a list of InputStates one per tick, holding the last one
+    def __init__(self, states=None):
+        self.states = list(states) if states else [InputState(pick=0)]
+        self.tick = 0
+
+    def read(self, game):
+        st = self.states[min(self.tick, len(self.states) - 1)]
+        self.tick += 1
+        return st
+
+# replay files: a header, then one record per Game.update that read input, with upgrade picks
+# made from the keyboard and restarts interleaved where they happened, then the final digest.
+# A record's first byte is dx+1 | dy+1 << 2 | sprint << 4 | pick+1 << 5 | aim follows << 7,
+# and dx+1 == 3 marks an event instead (kind in bits 2-3, pick+1 in bits 5-6).
+REPLAY_MAGIC = b"ZRR1"
+REPLAY_HEADER = struct.Struct("<4sQHBH")  # magic, seed, tick rate, flags (1 arrays, 2 LOD), obstacle count
+REPLAY_AIM = struct.Struct("<hh")
+REPLAY_EVENT = 3
+EV_PICK, EV_RESET, EV_END = 0, 1, 2
+
+class InputRecorder:
+    # packs a session as seed + per-tick input: one byte per tick, five when the mouse moved
+    def __init__(self, seed, tick_rate, array_store=False, obstacles=0, lod=False):
+        flags = int(bool(array_store)) | int(bool(lod)) << 1
+        self.header = REPLAY_HEADER.pack(REPLAY_MAGIC, seed, tick_rate, flags, obstacles)
+        self.data = bytearray()
+        self.aim = None
+        self.ticks = 0
+
+    def record_tick(self, inp):
+        dx, dy = inp.move
+        if dx not in (-1, 0, 1) or dy not in (-1, 0, 1):
+            raise ValueError(f"only digital movement can be recorded, got {inp.move}")
+        b = (int(dx) + 1) | (int(dy) + 1) << 2 | bool(inp.sprint) << 4
+        if inp.pick is not None:
+            b |= (inp.pick + 1) << 5
+        aim = (int(clamp(inp.aim[0], -32768, 32767)), int(clamp(inp.aim[1], -32768, 32767)))
+        if aim != self.aim:
+            self.aim = aim
+            self.data.append(b | 0x80)
+            self.data += REPLAY_AIM.pack(*aim)
+        else:
+            self.data.append(b)
+        self.ticks += 1
+
+    def record_pick(self, index):
+        self.data.append(REPLAY_EVENT | EV_PICK << 2 | (index + 1) << 5)
+
+    def record_reset(self):
+        self.data.append(REPLAY_EVENT | EV_RESET << 2)
+
+    def save(self, path, digest=None):
+        # without a digest (a session cut short by an error) the file just ends after the last tick
+        with open(path, "wb") as f:
+            f.write(self.header)
+            f.write(self.data)
+            if digest is not None:
+                f.write(bytes((REPLAY_EVENT | EV_END << 2,)))
+                f.write(bytes.fromhex(digest))
+
+class Replay:
+    def __init__(self, data):
+        magic, self.seed, self.tick_rate, flags, self.obstacles = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError("not a zombierush replay")
+        self.array_store = bool(flags & 1)
+        self.lod = bool(flags & 2)
+        self.data = data[REPLAY_HEADER.size:]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def records(self):
+        # yields ("tick", InputState), ("pick", index), ("reset", None) and ("end", digest)
+        data = self.data
+        aim = (SCREEN_W, SCREEN_H / 2)
+        i = 0
+        while i < len(data):
+            b = data[i]
+            i += 1
+            if b & 3 == REPLAY_EVENT:
+                kind = b >> 2 & 3
+                if kind == EV_PICK:
+                    yield "pick", (b >> 5 & 3) - 1
+                elif kind == EV_RESET:
+                    yield "reset", None
+                else:
+                    yield "end", data[i:i + 20].hex()
+                    return
+                continue
+            if b & 0x80:
+                aim = REPLAY_AIM.unpack_from(data, i)
+                i += REPLAY_AIM.size
+            pick = (b >> 5 & 3) - 1
+            yield "tick", InputState(((b & 3) - 1, (b >> 2 & 3) - 1), bool(b & 0x10), aim,
+                                     pick if pick >= 0 else None)
+
+class ReplayInput:
+    # hands Game.update whatever run_replay() decoded for this tick
+    def __init__(self):
+        self.state = InputState()
+
+    def read(self, game):
+        return self.state
+
+# snapshot files: header, game and player scalars, RNG states, level-up state, then per entity
+# kind a pool stamp and one row of float64 columns per listed entity (vectors take two).
+# Array stores also write their slot numbers and free list so a restore lands in the same slots.
+SNAPSHOT_MAGIC = b"ZRS5"
+SNAPSHOT_HEADER = struct.Struct("<4sB")  # magic, flags: 1 array store, 2 enemy store RNG
+SNAPSHOT_GAME = struct.Struct("<3d4q5?")
+SNAPSHOT_UPGRADES = struct.Struct("<BI")  # level-up options, upgrade log length
+SNAPSHOT_COUNTS = struct.Struct("<IQ")  # entities, pool stamp
+SNAPSHOT_FREE = struct.Struct("<II")  # array store capacity, free slots
+SNAPSHOT_XP_PARTS = struct.Struct("<I")  # folded XP parts, then (orb, value, count) int64 triples
+SNAPSHOT_FIELD = struct.Struct("<?2q?2qQ")  # flow field goal, pending rebuild goal, its steps so far
+SNAPSHOT_NP_RNG = struct.Struct("<16s16sBQ")  # PCG64 state, increment, has_uint32, uinteger
+SNAPSHOT_PLAYER = (("radius", "q"), ("speed", "d"), ("sprint_mult", "d"), ("hp", "d"), ("max_hp", "q"),
+                   ("fire_cooldown", "d"), ("fire_timer", "d"), ("projectile_speed", "d"),
+                   ("projectile_damage", "q"), ("projectile_count", "q"), ("spread_deg", "d"), ("pierce", "q"),
+                   ("xp", "q"), ("level", "q"), ("xp_to_next", "q"), ("xp_boost", "d"), ("kills", "q"))
+SNAPSHOT_PLAYER_STRUCT = struct.Struct("<4d" + "".join(f for _, f in SNAPSHOT_PLAYER))
+SNAPSHOT_RNG = struct.Struct("<625Id")
+SNAPSHOT_COLUMNS = {
+    "enemies": ("pos", "prev", "vel", "speed", "hp", "max_hp", "radius", "score", "xp", "born", "active"),
+    "projectiles": ("pos", "prev", "vel", "speed", "life", "max_life", "damage", "radius", "pierce", "born", "active"),
+    "xps": ("pos", "prev", "radius", "value", "count", "life", "born", "active"),
+}
+SNAPSHOT_VECTORS = ("pos", "prev", "vel")
+SNAPSHOT_INTS = ("hp", "max_hp", "radius", "score", "xp", "born", "damage", "pierce", "value", "count")
+
+def check_snapshot(data):
+    if len(data) < SNAPSHOT_HEADER.size or SNAPSHOT_HEADER.unpack_from(data)[0] != SNAPSHOT_MAGIC:
+        raise ValueError("not a zombierush snapshot, or one from another version")
+
+def snapshot_width(fields):
+    return sum(2 if f in SNAPSHOT_VECTORS else 1 for f in fields)
+
+def pack_entities(pool, items, fields):
+    # one float64 row per entity in list order; array stores gather whole columns at once
+    if isinstance(pool, ArrayPool) and items:
+        st = pool.store
+        slots = np.fromiter((o.i for o in items), dtype=np.int64, count=len(items))
+        cls = type(items[0])
+        cols = []
+        for f in fields:
+            if f == "active":
+                cols.append(st.active[slots])
+            elif isinstance(getattr(cls, f, None), property):
+                cols.append(getattr(st, f)[slots])
+            else:
+                cols.append(np.array([getattr(o, f) for o in items], dtype=np.float64))
+        rows = np.column_stack(cols).astype(np.float64)
+        return rows.tobytes() + slots.tobytes()
+    flat = array("d")
+    for o in items:
+        for f in fields:
+            v = getattr(o, f)
+            if f in SNAPSHOT_VECTORS:
+                flat.append(v.x)
+                flat.append(v.y)
+            else:
+                flat.append(v)
+    return flat.tobytes()
+
+def unpack_entities(pool, items, fields, data, n, slots=None, free=None):
+    # inverse of pack_entities(); with slots and free the array store is rebuilt slot for slot
+    items.clear()
+    pool.release_all()
+    width = snapshot_width(fields)
+    if isinstance(pool, ArrayPool):
+        st = pool.store
+        rows = np.frombuffer(data, dtype=np.float64).reshape(n, width)
+        if slots is None:
+            slots = np.arange(n, dtype=np.int64)
+        if n and slots.max() >= st.capacity:
+            st.grow(max(st.capacity * 2, int(slots.max()) + 1))
+            pool.sync_handles()
+        if free is None:
+            taken = set(slots.tolist())
+            free = [i for i in st.free if i not in taken]
+        st.free = list(free)
+        st.used[slots] = True
+        items.extend(pool.handles[i] for i in slots.tolist())
+        col = 0
+        for f in fields:
+            vals = rows[:, col:col + 2] if f in SNAPSHOT_VECTORS else rows[:, col]
+            col += 2 if f in SNAPSHOT_VECTORS else 1
+            if f == "active":
+                st.active[slots] = vals != 0
+            elif isinstance(getattr(pool.cls, f, None), property):
+                getattr(st, f)[slots] = vals
+            else:
+                conv = int if f in SNAPSHOT_INTS else float
+                for o, v in zip(items, vals.tolist()):
+                    setattr(o, f, conv(v))
+        return
+    flat = array("d")
+    flat.frombytes(data)
+    for r in range(n):
+        o = pool.spawn(items)
+        col = r * width
+        for f in fields:
+            if f in SNAPSHOT_VECTORS:
+                getattr(o, f).update(flat[col], flat[col + 1])
+                col += 2
+            else:
+                v = flat[col]
+                col += 1
+                if f == "active":
+                    o.active = v != 0
+                else:
+                    setattr(o, f, int(v) if f in SNAPSHOT_INTS else v)
 
 class ObjectPool:
-    def __init__(self, cls, size, *args, **kwargs):
+    # overflow decides what happens when the free list is empty and max_size objects exist:
+    # "grow" allocates anyway, "refuse" returns None, "recycle" reuses the oldest object
+    def __init__(self, cls, size, *args, max_size=None, overflow="grow", **kwargs):
         self.cls = cls
+        self.args = args
+        self.kwargs = kwargs
+        self.max_size = max_size
+        self.overflow = overflow
         self.free = []
         self.all = []
+        self.stamp = 0
+        self.high_water = 0
+        self.misses = 0
+        self.allocs = 0
+        self.refused = 0
+        self.recycled = 0
         for _ in range(size):
             o = cls(*args, **kwargs)
             o.active = False
+            o.born = 0
             self.free.append(o)
             self.all.append(o)
 
     def acquire(self, *args, **kwargs):
+        return self.take(*args, **kwargs)[0]
+
+    def spawn(self, items, *args, **kwargs):
+        # acquire and add to the caller's live list; a recycled object is already in it
+        o, recycled = self.take(*args, **kwargs)
+        if o is not None and not recycled:
+            items.append(o)
+        return o
+
+    def take(self, *args, **kwargs):
+        # returns (object or None, whether it was taken back from a live list)
+        recycled = False
         if self.free:
             o = self.free.pop()
-            o.reset(*args, **kwargs)
-            o.active = True
-            return o
         else:
-            o = self.cls(*args, **kwargs)
+            self.misses += 1
+            if self.max_size is None or len(self.all) < self.max_size or self.overflow == "grow":
+                o = self.cls(*self.args, **self.kwargs)
+                self.all.append(o)
+                self.allocs += 1
+            elif self.overflow == "refuse":
+                self.refused += 1
+                return None, False
+            else:
+                # everything is in some live list; prefer one that died but isn't compacted yet
+                o = next((x for x in self.all if not x.active), None)
+                if o is None:
+                    o = min(self.all, key=lambda x: x.born)
+                self.recycled += 1
+                recycled = True
+        self.stamp += 1
+        o.born = self.stamp
+        o.reset(*args, **kwargs)
+        o.active = True
+        in_use = len(self.all) - len(self.free)
+        if in_use > self.high_water:
+            self.high_water = in_use
+        return o, recycled
+
+    def spawn_many(self, items, specs):
+        # spawn() for each dict of reset() arguments, taking free objects off the list in one slice
+        free = self.free
+        n = min(len(specs), len(free))
+        batch = free[len(free) - n:]
+        del free[len(free) - n:]
+        batch.reverse()  # the order n pop()s would give
+        for o, kwargs in zip(batch, specs):
+            self.stamp += 1
+            o.born = self.stamp
+            o.reset(**kwargs)
             o.active = True
-            self.all.append(o)
-            return o
+        items.extend(batch)
+        in_use = len(self.all) - len(free)
+        if in_use > self.high_water:
+            self.high_water = in_use
+        for kwargs in specs[n:]:
+            self.spawn(items, **kwargs)
 
     def release(self, o):
         o.active = False
         self.free.append(o)
 
+    def release_all(self):
+        for o in self.all:
+            o.active = False
+        self.free = list(self.all)
+
+    def compact(self, items):
+        # sweep deactivated objects out of items in one in-place pass, releasing them
+        j = 0
+        for o in items:
+            if o.active:
+                items[j] = o
+                j += 1
+            else:
+                self.release(o)
+        del items[j:]
+
+    def stats(self):
+        return {"size": len(self.all), "free": len(self.free), "high_water": self.high_water,
+                "misses": self.misses, "allocs": self.allocs, "refused": self.refused,
+                "recycled": self.recycled, "suggested": suggest_pool_size(self.high_water)}
+
+def suggest_pool_size(high_water):
+    # initial size that would have absorbed the observed peak with some headroom
+    return int(math.ceil(high_water * 1.25 / 8.0)) * 8
+
+class FixedStep:
+    # turns variable frame time into whole simulation ticks of 1/rate seconds;
+    # at most max_substeps run per frame and any backlog beyond that is dropped
+    def __init__(self, rate=TICK_RATE, max_substeps=MAX_SUBSTEPS):
+        self.dt = 1.0 / rate
+        self.max_substeps = max_substeps
+        self.accum = 0.0
+        self.dropped = 0.0
+
+    def advance(self, frame_dt):
+        self.accum += frame_dt
+        n = int(self.accum / self.dt)
+        if n > self.max_substeps:
+            self.dropped += (n - self.max_substeps) * self.dt
+            self.accum -= (n - self.max_substeps) * self.dt
+            n = self.max_substeps
+        self.accum -= n * self.dt
+        return n
+
+    def alpha(self):
+        # fraction of a tick left over, for interpolating the render
+        return clamp(self.accum / self.dt, 0.0, 1.0)
+
+    def hold(self):
+        # paused or in a menu: don't bank time
+        self.accum = 0.0
+
+class Profiler:
+    # per-frame phase timings: start() opens a frame section, lap(name) charges the
+    # time since the previous mark to name; repeated laps of one name add up
+    enabled = True
+
+    def __init__(self, history=PROFILE_HISTORY):
+        self.phases = {}
+        self.t = 0.0
+        self.frames = deque(maxlen=history)
+
+    def start(self):
+        self.t = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self.t)
+        self.t = now
+
+    def take(self):
+        phases = self.phases
+        self.phases = {}
+        return phases
+
+    def end_frame(self, counts=None):
+        self.frames.append((self.take(), counts or {}))
+
+    def export_csv(self, path):
+        names = []
+        keys = []
+        for phases, counts in self.frames:
+            names.extend(n for n in phases if n not in names)
+            keys.extend(k for k in counts if k not in keys)
+        with open(path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["frame"] + [f"{n}_ms" for n in names] + ["total_ms"] + keys)
+            for i, (phases, counts) in enumerate(self.frames):
+                ms = [phases.get(n, 0.0) * 1000.0 for n in names]
+                w.writerow([i] + [f"{v:.4f}" for v in ms] + [f"{sum(ms):.4f}"] + [counts.get(k, "") for k in keys])
+        return len(self.frames)
+
+class NullProfiler:
+    # stands in while profiling is off so the hot path only pays for empty calls
+    enabled = False
+    frames = ()
+
+    def start(self):
+        pass
+
+    def lap(self, name):
+        pass
+
+    def take(self):
+        return {}
+
+    def end_frame(self, counts=None):
+        pass
+
+class SpriteCache:
+    # pre-rendered circles and health bars, keyed by size and colour
+    KEY = (255, 0, 255)
+
+    def __init__(self):
+        self.circles = {}
+        self.bars = {}
+        self.dots = {}
+
+    def keyed(self, w, h):
+        surf = pygame.Surface((w, h))
+        surf.fill(self.KEY)
+        surf.set_colorkey(self.KEY, pygame.RLEACCEL)
+        return surf
+
+    def circle(self, radius, color):
+        k = (radius, color)
+        surf = self.circles.get(k)
+        if surf is None:
+            surf = self.keyed(radius * 2 + 1, radius * 2 + 1)
+            pygame.draw.circle(surf, color, (radius, radius), radius)
+            if pygame.display.get_surface() is not None:
+                surf = surf.convert()
+            self.circles[k] = surf
+        return surf
+
+    def dot(self, size, color):
+        # particle: a size x size square
+        k = (size, color)
+        surf = self.dots.get(k)
+        if surf is None:
+            surf = pygame.Surface((size, size))
+            surf.fill(color)
+            if pygame.display.get_surface() is not None:
+                surf = surf.convert()
+            self.dots[k] = surf
+        return surf
+
+    def bar(self, radius, fill):
+        # enemy health bar: fill px of green inside a 2r x 5 outline
+        k = (radius, fill)
+        surf = self.bars.get(k)
+        if surf is None:
+            surf = self.keyed(radius * 2, 5)
+            pygame.draw.rect(surf, (80, 200, 80), pygame.Rect(0, 0, fill, 5))
+            pygame.draw.rect(surf, (50,50,50), pygame.Rect(0, 0, radius * 2, 5), 1)
+            if pygame.display.get_surface() is not None:
+                surf = surf.convert()
+            self.bars[k] = surf
+        return surf
+
+class TextCache:
+    # rendered text surfaces keyed by (text, font, colour), least recently used evicted first
+    def __init__(self, size=TEXT_CACHE_SIZE):
+        self.size = size
+        self.surfs = OrderedDict()
+
+    def render(self, fnt, text, color):
+        k = (text, fnt, color)
+        surf = self.surfs.get(k)
+        if surf is None:
+            surf = fnt.render(text, True, color)
+            self.surfs[k] = surf
+            if len(self.surfs) > self.size:
+                self.surfs.popitem(last=False)
+        else:
+            self.surfs.move_to_end(k)
+        return surf
+
+class GroundLayer:
+    # the floor as CHUNK_SIZE squares generated from (seed, chunk x, chunk y), so an evicted
+    # chunk comes back identical. A daemon thread renders the chunks prefetch() asks for, nearest
+    # the middle first; draw() only blits cached ones, and at most capacity are kept (LRU)
+    def __init__(self, seed, size=CHUNK_SIZE, capacity=CHUNK_CACHE):
+        self.seed = seed
+        self.size = size
+        self.capacity = capacity
+        self.chunks = OrderedDict()
+        self.lock = threading.Lock()
+        self.window = None
+        self.requests = queue.SimpleQueue()
+        self.thread = None
+        self.generated = 0
+
+    def prefetch(self, x0, y0, x1, y1):
+        # a world rect to have ready; nothing to do unless it spans different chunks than last time.
+        # Both the simulation and the main thread call this under --threaded, hence the lock
+        inv = 1.0 / self.size
+        window = (math.floor(x0 * inv), math.floor(y0 * inv), math.floor(x1 * inv), math.floor(y1 * inv))
+        with self.lock:
+            if window == self.window:
+                return
+            self.window = window
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="ground", daemon=True)
+                self.thread.start()
+            self.requests.put(window)
+
+    def run(self):
+        requests = self.requests
+        while True:
+            window = requests.get()
+            while not requests.empty():
+                window = requests.get()
+            x0, y0, x1, y1 = window
+            mx, my = (x0 + x1) / 2, (y0 + y1) / 2
+            keys = sorted(((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)),
+                          key=lambda k: (k[0] - mx) ** 2 + (k[1] - my) ** 2)
+            for key in keys:
+                if not requests.empty():
+                    break  # the camera moved on; start over from the newest window
+                with self.lock:
+                    if key in self.chunks:
+                        continue
+                surf = self.render(key)
+                with self.lock:
+                    self.chunks[key] = surf
+                    self.generated += 1
+                    while len(self.chunks) > self.capacity:
+                        self.chunks.popitem(last=False)
+
+    def render(self, key):
+        s = self.size
+        rng = random.Random(f"{self.seed}:{key[0]}:{key[1]}")
+        display = pygame.display.get_surface()
+        surf = pygame.Surface((s, s), 0, display) if display is not None else pygame.Surface((s, s))
+        surf.fill(C_BG)
+        # patches stay inside the chunk so there are no seams at its edges
+        for _ in range(rng.randint(3, 8)):
+            r = rng.randint(24, 72)
+            pygame.draw.circle(surf, C_GROUND[2], (rng.randint(r, s - r), rng.randint(r, s - r)), r)
+        for i in range(0, s, 128):
+            surf.fill(C_GROUND_LINE, (i, 0, 1, s))
+            surf.fill(C_GROUND_LINE, (0, i, s, 1))
+        for _ in range(260):
+            w = rng.randint(1, 3)
+            surf.fill(C_GROUND[rng.randrange(2)], (rng.randrange(s), rng.randrange(s), w, w))
+        return surf
+
+    def draw(self, surf, cx, cy):
+        # blit the chunks under the view at camera (cx, cy); ones not generated yet are left as C_BG
+        s = self.size
+        ox, oy = int(math.floor(cx)), int(math.floor(cy))
+        x0, y0 = ox // s, oy // s
+        x1, y1 = (ox + SCREEN_W - 1) // s, (oy + SCREEN_H - 1) // s
+        seq = []
+        with self.lock:
+            for ky in range(y0, y1 + 1):
+                for kx in range(x0, x1 + 1):
+                    chunk = self.chunks.get((kx, ky))
+                    pos = (kx * s - ox, ky * s - oy)
+                    if chunk is None:
+                        surf.fill(C_BG, (pos[0], pos[1], s, s))
+                    else:
+                        self.chunks.move_to_end((kx, ky))
+                        seq.append((chunk, pos))
+        surf.blits(seq, False)
+
+class SpatialHash:
+    # uniform grid keyed by cell coords; buckets hold indices into self.items
+    def __init__(self, cell_size=SPATIAL_CELL):
+        self.cell_size = cell_size
+        self.inv = 1.0 / cell_size
+        self.cells = {}
+        # keys of the buckets that hold something, so clear() only visits those
+        self.filled = []
+        self.own = []
+        self.items = self.own
+        self.max_radius = 0
+        self.max_move = 0.0
+
+    def clear(self):
+        # empty the filled buckets in place so a steady-state rebuild allocates nothing; the
+        # empty ones cost nothing per tick and are only dropped once they pile up behind a
+        # moving crowd
+        cells = self.cells
+        if len(cells) > SPATIAL_MAX_CELLS:
+            cells.clear()
+        else:
+            for k in self.filled:
+                cells[k].clear()
+        self.filled.clear()
+        self.own.clear()
+        self.items = self.own
+        self.max_radius = 0
+        self.max_move = 0.0
+
+    def cell(self, x, y):
+        return (math.floor(x * self.inv), math.floor(y * self.inv))
+
+    def insert(self, o):
+        self.items.append(o)
+        self.add(len(self.items) - 1, o)
+
+    def add(self, i, o):
+        # bucket an item that is already items[i]
+        k = self.cell(o.pos.x, o.pos.y)
+        bucket = self.cells.get(k)
+        if bucket is None:
+            self.cells[k] = [i]
+            self.filled.append(k)
+        else:
+            if not bucket:
+                self.filled.append(k)
+            bucket.append(i)
+        if o.radius > self.max_radius:
+            self.max_radius = o.radius
+
+    def rebuild(self, objs):
+        # also notes the longest prev -> pos move, since items are bucketed where they ended up
+        self.clear()
+        move = 0.0
+        for o in objs:
+            if o.active:
+                self.insert(o)
+                p, q = o.pos, o.prev
+                dx = p.x - q.x
+                dy = p.y - q.y
+                if dx*dx + dy*dy > move:
+                    move = dx*dx + dy*dy
+        self.max_move = math.sqrt(move)
+
+    def rebuild_arrays(self, store, handles, idx=None):
+        # same buckets as rebuild(), built from an EntityArrays store (only rows idx if given);
+        # items are pool slots
+        self.clear()
+        self.items = handles
+        if idx is None:
+            idx = np.flatnonzero(store.active)
+        if not len(idx):
+            return
+        cells = np.floor(store.pos[idx] * self.inv).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        cells = cells[order]
+        idx = idx[order]
+        bounds = np.flatnonzero(np.any(cells[1:] != cells[:-1], axis=1)) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(idx)]
+        # one tolist() each for keys and indices; slicing Python lists is far cheaper per cell
+        # refill the emptied buckets rather than making new lists; a few thousand fresh lists
+        # a tick is enough to keep the cyclic GC busy
+        ids = idx.tolist()
+        buckets = self.cells
+        # clear() left filled empty, so it ends up holding exactly this rebuild's keys
+        self.filled.extend(map(tuple, cells[starts].tolist()))
+        for key, a, b in zip(self.filled, starts, ends):
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = ids[a:b]
+            else:
+                bucket.extend(ids[a:b])
+        self.max_radius = float(store.radius[idx].max())
+        d = store.pos[idx] - store.prev[idx]
+        self.max_move = float(np.sqrt((d * d).sum(axis=1).max()))
+
+    def query(self, pos, radius):
+        # indices of every item whose circle may touch (pos, radius), in insertion order
+        return self.query_box(pos.x - radius, pos.y - radius, pos.x + radius, pos.y + radius)
+
+    def query_box(self, left, top, right, bottom):
+        # indices of every item whose circle may touch the box, in insertion order
+        r = self.max_radius
+        x0, y0 = self.cell(left - r, top - r)
+        x1, y1 = self.cell(right + r, bottom + r)
+        cells = self.cells
+        out = []
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    out.extend(bucket)
+        if len(out) > 1:
+            out.sort()
+        return out
+
+    def hits(self, pos, radius):
+        # items overlapping the circle, in insertion order
+        items = self.items
+        px, py = pos.x, pos.y
+        ret = []
+        for i in self.query(pos, radius):
+            o = items[i]
+            if not o.active: continue
+            op = o.pos
+            dx = op.x - px
+            dy = op.y - py
+            r = radius + o.radius
+            if dx*dx + dy*dy <= r*r:
+                ret.append(o)
+        return ret
+
+class FlowField:
+    # one steering field around the player, shared by every enemy; rebuilt only when the
+    # player changes cell, so pathing costs the same for ten enemies or ten thousand. The
+    # rebuild is spread over ticks, FLOW_BUILD_STEPS at a time, so no tick pays for all of it
+    def __init__(self, obstacles=(), cell_size=FLOW_CELL, radius=FLOW_RADIUS):
+        self.cell_size = cell_size
+        self.inv = 1.0 / cell_size
+        self.radius = radius
+        self.size = 2 * radius + 1
+        # static obstacles rasterised onto a world-sized grid of solid cells
+        self.obstacles = [pygame.Rect(r) for r in obstacles]
+        self.world = int(math.ceil(WORLD_HALF * self.inv)) + radius
+        self.span = 2 * self.world
+        self.solid = bytearray(self.span * self.span)
+        for r in self.obstacles:
+            x0, y0 = self.cell(r.left, r.top)
+            x1, y1 = self.cell(r.right - 1, r.bottom - 1)
+            for cy in range(max(y0, -self.world), min(y1 + 1, self.world)):
+                row = (cy + self.world) * self.span
+                for cx in range(max(x0, -self.world), min(x1 + 1, self.world)):
+                    self.solid[row + cx + self.world] = 1
+        # the window is stored with a one-cell wall border so the search needs no bounds checks
+        w = self.pitch = self.size + 2
+        # (index offset, cost, direction back to the parent, the two cells a diagonal squeezes past)
+        self.steps = []
+        for sx, sy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            cost = math.hypot(sx, sy)
+            self.steps.append((sy * w + sx, cost, (-sx / cost, -sy / cost), sx, sy * w))
+        # octile distance of every window cell to the centre: a cell whose path is no longer
+        # than this can walk straight at the target
+        self.open_dist = [math.inf] * (w * w)
+        for j in range(self.size):
+            for i in range(self.size):
+                ax, ay = abs(i - radius), abs(j - radius)
+                self.open_dist[(j + 1) * w + i + 1] = max(ax, ay) + (math.sqrt(2) - 1) * min(ax, ay) + 1e-9
+        self.builds = 0
+        self.reset()
+
+    def reset(self):
+        self.flow = [None] * (self.pitch * self.pitch)
+        self.goal = None
+        self.origin = (0, 0)
+        self.arrays = None
+        # (goal, origin, walls, dist, flow, heap) of the search in progress, and its steps so far
+        self.pending = None
+        self.progress = 0
+
+    def cell(self, x, y):
+        return (math.floor(x * self.inv), math.floor(y * self.inv))
+
+    def blocked(self, x, y):
+        cx = math.floor(x * self.inv) + self.world
+        cy = math.floor(y * self.inv) + self.world
+        return 0 <= cx < self.span and 0 <= cy < self.span and self.solid[cy * self.span + cx] == 1
+
+    def update(self, target, steps=FLOW_BUILD_STEPS):
+        # flow is None wherever walking straight at the target is already a shortest path,
+        # which is everywhere when there are no obstacles. The first field after reset() is
+        # built whole; later ones finish a few ticks after the player enters the cell, and a
+        # cell change during a rebuild is picked up once it is done. True when the field changed
+        goal = self.cell(target.x, target.y)
+        if not self.obstacles:
+            if goal == self.goal:
+                return False
+            self.goal = goal
+            self.origin = (goal[0] - self.radius, goal[1] - self.radius)
+            return True
+        if self.pending is None:
+            if goal == self.goal:
+                return False
+            if self.goal is None:
+                steps = math.inf
+            self.start(goal)
+        return self.build(steps)
+
+    def seek(self, goal, pending=None, progress=0):
+        # put the field back where update() had it: goal's field done, pending progress steps in
+        self.reset()
+        if goal is not None and not self.obstacles:
+            self.goal = goal
+            self.origin = (goal[0] - self.radius, goal[1] - self.radius)
+            return
+        if goal is not None:
+            self.start(goal)
+            self.build(math.inf)
+        if pending is not None:
+            self.start(pending)
+            self.build(progress)
+
+    def walls(self, origin):
+        # window-sized copy of the solid grid inside a wall border; off the grid is open ground
+        size, w = self.size, self.pitch
+        ox, oy = origin
+        walls = bytearray(w * w)
+        walls[:w] = walls[-w:] = b"\1" * w
+        walls[::w] = walls[w - 1::w] = b"\1" * w
+        x0 = max(0, ox + self.world)
+        x1 = min(self.span, ox + size + self.world)
+        for j in range(size):
+            cy = oy + j + self.world
+            if 0 <= cy < self.span and x0 < x1:
+                row = (j + 1) * w + 1 + x0 - (ox + self.world)
+                walls[row:row + x1 - x0] = self.solid[cy * self.span + x0:cy * self.span + x1]
+        return walls
+
+    def start(self, goal):
+        # set up a Dijkstra search over the window from the goal cell for build() to run
+        w = self.pitch
+        origin = (goal[0] - self.radius, goal[1] - self.radius)
+        dist = [math.inf] * (w * w)
+        start = (self.radius + 1) * w + self.radius + 1
+        dist[start] = 0.0
+        self.pending = (goal, origin, self.walls(origin), dist, [None] * (w * w), [(0.0, start)])
+        self.progress = 0
+
+    def build(self, steps):
+        # run up to steps heap pops of the pending search, every reached cell pointing at its
+        # parent; when the heap runs dry the new field replaces the old one
+        goal, origin, walls, dist, flow, heap = self.pending
+        pop, push = heapq.heappop, heapq.heappush
+        done = 0
+        while heap and done < steps:
+            done += 1
+            d, c = pop(heap)
+            if d > dist[c]:
+                continue
+            for step, cost, back, sx, sy in self.steps:
+                n = c + step
+                if walls[n]:
+                    continue
+                # diagonals may not cut across the corner of a wall
+                if sx and sy and (walls[c + sx] or walls[c + sy]):
+                    continue
+                nd = d + cost
+                if nd < dist[n]:
+                    dist[n] = nd
+                    flow[n] = back
+                    push(heap, (nd, n))
+        self.progress += done
+        if heap:
+            return False
+        open_dist = self.open_dist
+        for c in range(len(flow)):
+            if flow[c] is not None and dist[c] <= open_dist[c]:
+                flow[c] = None
+        self.flow = flow
+        self.goal = goal
+        self.origin = origin
+        self.arrays = None
+        self.pending = None
+        self.builds += 1
+        return True
+
+    def sample(self, x, y):
+        # unit steering vector for a world position, or None to head straight for the target
+        i = math.floor(x * self.inv) - self.origin[0]
+        j = math.floor(y * self.inv) - self.origin[1]
+        if 0 <= i < self.size and 0 <= j < self.size:
+            return self.flow[(j + 1) * self.pitch + i + 1]
+        return None
+
+    def sample_arrays(self, pos):
+        # vectorised sample(): per-row steering vectors and a mask of rows that have one
+        if self.arrays is None:
+            fx = np.zeros(len(self.flow))
+            fy = np.zeros(len(self.flow))
+            has = np.zeros(len(self.flow), dtype=bool)
+            for c, f in enumerate(self.flow):
+                if f is not None:
+                    fx[c], fy[c] = f
+                    has[c] = True
+            self.arrays = (fx, fy, has)
+        fx, fy, has = self.arrays
+        cells = np.floor(pos * self.inv).astype(np.int64) - self.origin
+        inside = np.all((cells >= 0) & (cells < self.size), axis=1)
+        c = np.where(inside, (cells[:, 1] + 1) * self.pitch + cells[:, 0] + 1, 0)
+        ok = inside & has[c]
+        return fx[c], fy[c], ok
+
+    def blocked_arrays(self, pos):
+        cells = np.floor(pos * self.inv).astype(np.int64) + self.world
+        inside = np.all((cells >= 0) & (cells < self.span), axis=1)
+        c = np.where(inside, cells[:, 1] * self.span + cells[:, 0], 0)
+        return inside & (np.frombuffer(self.solid, dtype=np.uint8)[c] == 1)
+
+    def collide(self, o):
+        # undo the part of this tick's move that ended inside an obstacle, sliding along it
+        self.slide(o.pos, o.prev.x, o.prev.y)
+
+    def slide(self, pos, px, py):
+        # collide() for a move from (px, py) to pos
+        if not self.blocked(pos.x, pos.y) or self.blocked(px, py):
+            return
+        if not self.blocked(pos.x, py):
+            pos.y = py
+        elif not self.blocked(px, pos.y):
+            pos.x = px
+        else:
+            pos.update(px, py)
+
+def scatter_obstacles(n, rng, keep_clear=160):
+    # random wall segments and blocks, leaving the player's start open
+    rects = []
+    while len(rects) < n:
+        if rng.random() < 0.5:
+            w, h = rng.choice(((rng.randint(4, 10) * FLOW_CELL, FLOW_CELL), (FLOW_CELL, rng.randint(4, 10) * FLOW_CELL)))
+        else:
+            w = h = rng.randint(2, 4) * FLOW_CELL
+        x = rng.randint(-WORLD_HALF // FLOW_CELL, WORLD_HALF // FLOW_CELL) * FLOW_CELL
+        y = rng.randint(-WORLD_HALF // FLOW_CELL, WORLD_HALF // FLOW_CELL) * FLOW_CELL
+        r = pygame.Rect(x, y, w, h)
+        if r.inflate(2 * keep_clear, 2 * keep_clear).collidepoint(0, 0):
+            continue
+        rects.append(r)
+    return rects
+
 class Projectile:
+    __slots__ = ("active", "pos", "prev", "vel", "speed", "life", "max_life", "damage", "radius",
+                 "pierce", "born")
+
     def __init__(self):
         self.active = False
         self.pos = vec()
+        self.prev = vec()
         self.vel = vec()
         self.speed = BASE_PROJECTILE_SPEED
         self.life = 0.0
-        self.max_life = 2.4
+        self.max_life = PROJECTILE_LIFE
         self.damage = BASE_PROJECTILE_DAMAGE
         self.radius = 6
         self.pierce = 0
 
     def reset(self, pos=(0,0), direction=(1,0), speed=None, damage=None, life=None):
         self.pos = vec(pos)
+        self.prev = vec(self.pos)
         d = vec(direction)
         if d.length() == 0:
             d = vec(1,0)
@@ -109,50 +1202,55 @@ class Projectile:
         self.max_life = life if life is not None else self.max_life
         self.life = self.max_life
         self.radius = 6
-        self.pierce = getattr(self, "pierce", 0)
 
     def update(self, dt):
         if not self.active: return
-        self.pos += self.vel * dt
+        pos = self.pos
+        vel = self.vel
+        self.prev.update(pos)
+        pos.x += vel.x * dt
+        pos.y += vel.y * dt
         self.life -= dt
         if self.life <= 0:
             self.active = False
 
-    def draw(self, surf, cam):
-        if not self.active: return
-        p = self.pos - cam
-        pygame.draw.circle(surf, C_PROJECTILE, (int(p.x), int(p.y)), self.radius)
-
 class XP:
+    __slots__ = ("active", "pos", "prev", "radius", "value", "count", "parts", "life", "born")
+
     def __init__(self):
         self.active = False
         self.pos = vec()
+        self.prev = vec()
         self.radius = 6
         self.value = 1
+        self.count = 1
+        self.parts = None  # {value: count} of other drops folded in at the live cap
         self.life = 10.0
 
     def reset(self, pos=(0,0), value=1):
         self.pos = vec(pos)
+        self.prev = vec(self.pos)
         self.value = value
-        self.life = 12.0
+        self.count = 1
+        self.parts = None
+        self.life = XP_LIFE
         self.radius = 6
         self.active = True
 
     def update(self, dt):
         if not self.active: return
+        self.prev.update(self.pos)
         self.life -= dt
         if self.life <= 0:
             self.active = False
 
-    def draw(self, surf, cam):
-        if not self.active: return
-        p = self.pos - cam
-        pygame.draw.circle(surf, C_XP, (int(p.x), int(p.y)), self.radius)
-
 class Enemy:
+    __slots__ = ("active", "pos", "prev", "vel", "speed", "hp", "max_hp", "radius", "score", "xp", "born")
+
     def __init__(self):
         self.active = False
         self.pos = vec()
+        self.prev = vec()
         self.vel = vec()
         self.speed = ENEMY_BASE_SPEED
         self.hp = ENEMY_BASE_HP
@@ -163,6 +1261,7 @@ class Enemy:
 
     def reset(self, pos=(0,0), hp=None, speed=None, radius=None, score=None, xp=None):
         self.pos = vec(pos)
+        self.prev = vec(self.pos)
         self.vel = vec()
         self.speed = speed if speed is not None else ENEMY_BASE_SPEED
         self.max_hp = hp if hp is not None else ENEMY_BASE_HP
@@ -172,30 +1271,483 @@ class Enemy:
         self.xp = xp if xp is not None else XP_PER_KILL
         self.active = True
 
-    def update(self, dt, player_pos):
+    def update(self, dt, player_pos, rng=random, field=None, jitter=8):
         if not self.active: return
-        to = player_pos - self.pos
-        dist = to.length()
+        pos = self.pos
+        self.prev.update(pos)
+        dx = player_pos.x - pos.x
+        dy = player_pos.y - pos.y
+        if field is not None:
+            flow = field.sample(pos.x, pos.y)
+            if flow is not None:
+                dx, dy = flow
+        dist = math.sqrt(dx*dx + dy*dy)
         if dist > 0:
-            self.vel = to.normalize() * self.speed
-            jitter = vec(random.uniform(-8,8), random.uniform(-8,8))
-            self.pos += (self.vel + jitter) * dt
+            vx = dx / dist * self.speed
+            vy = dy / dist * self.speed
+            self.vel.update(vx, vy)
+            if jitter:
+                mx = (vx + rng.uniform(-jitter, jitter)) * dt
+                my = (vy + rng.uniform(-jitter, jitter)) * dt
+            else:
+                mx = vx * dt
+                my = vy * dt
+            if field is not None and field.obstacles:
+                # a far LOD move covers several ticks; take it in pieces of at most a cell per
+                # axis so it cannot step over a wall
+                n = math.ceil(max(abs(mx), abs(my)) * field.inv)
+                if n > 1:
+                    mx /= n
+                    my /= n
+                    for _ in range(n):
+                        px, py = pos.x, pos.y
+                        pos.x += mx
+                        pos.y += my
+                        field.slide(pos, px, py)
+                    return
+                pos.x += mx
+                pos.y += my
+                field.collide(self)
+            else:
+                pos.x += mx
+                pos.y += my
+
+class EntityArrays:
+    # struct-of-arrays storage; slot i of every array belongs to the same entity
+    FIELDS = ("pos", "prev", "vel", "hp", "max_hp", "speed", "radius", "life", "born", "active", "used")
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = 0
+        self.pos = np.zeros((0, 2))
+        self.prev = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.hp = np.zeros(0)
+        self.max_hp = np.zeros(0)
+        self.speed = np.zeros(0)
+        self.radius = np.zeros(0)
+        self.life = np.zeros(0)
+        self.born = np.zeros(0, dtype=np.int64)
+        self.active = np.zeros(0, dtype=bool)
+        self.used = np.zeros(0, dtype=bool)
+        self.free = []
+        self.rng = np.random.default_rng(seed)
+        self.grow(max(1, capacity))
+
+    def grow(self, capacity):
+        old = self.capacity
+        for name in self.FIELDS:
+            arr = getattr(self, name)
+            new = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new[:old] = arr
+            setattr(self, name, new)
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def alloc(self):
+        if not self.free:
+            self.grow(self.capacity * 2)
+        i = self.free.pop()
+        self.used[i] = True
+        self.active[i] = True
+        return i
+
+    def release(self, i):
+        self.active[i] = False
+        self.used[i] = False
+        self.free.append(i)
+
+    def release_all(self):
+        self.active[:] = False
+        self.used[:] = False
+        self.free = list(range(self.capacity - 1, -1, -1))
+
+    def collect(self):
+        # release every slot that was deactivated since the last call
+        dead = np.flatnonzero(self.used & ~self.active)
+        if len(dead):
+            self.used[dead] = False
+            self.free.extend(dead.tolist())
+        return len(dead)
+
+    def save_prev(self):
+        np.copyto(self.prev, self.pos)
+
+    def seek(self, target, dt, jitter=8.0, field=None, idx=None):
+        if idx is None:
+            idx = np.flatnonzero(self.active)
+        if not len(idx):
+            return
+        pos = self.pos[idx]
+        to = np.array((target.x, target.y)) - pos
+        if field is not None and field.obstacles:
+            fx, fy, ok = field.sample_arrays(pos)
+            to[ok, 0] = fx[ok]
+            to[ok, 1] = fy[ok]
+        dist = np.hypot(to[:, 0], to[:, 1])
+        moving = dist > 0
+        idx = idx[moving]
+        vel = to[moving] / dist[moving, None] * self.speed[idx, None]
+        self.vel[idx] = vel
+        if jitter:
+            vel = vel + self.rng.uniform(-jitter, jitter, (len(idx), 2))
+        if field is None or not field.obstacles:
+            self.pos[idx] = pos[moving] + vel * dt
+            return
+        # as in Enemy.update(), a far LOD move goes in pieces of at most a cell per axis
+        move = vel * dt
+        n = math.ceil(np.abs(move).max() * field.inv) if len(idx) else 1
+        if n <= 1:
+            self.pos[idx] = pos[moving] + move
+            self.collide(field, idx)
+            return
+        move /= n
+        for _ in range(n):
+            start = self.pos[idx]
+            self.pos[idx] = start + move
+            self.collide(field, idx, start)
+
+    def collide(self, field, idx, prev=None):
+        # FlowField.collide() for many rows: keep whichever axis of the move stays out of walls.
+        # The move starts at prev, or at the tick's start
+        pos = self.pos[idx]
+        prev = self.prev[idx] if prev is None else prev
+        hit = field.blocked_arrays(pos) & ~field.blocked_arrays(prev)
+        if not hit.any():
+            return
+        idx, pos, prev = idx[hit], pos[hit], prev[hit]
+        keep_x = np.column_stack((pos[:, 0], prev[:, 1]))
+        keep_y = np.column_stack((prev[:, 0], pos[:, 1]))
+        ok_x = ~field.blocked_arrays(keep_x)
+        ok_y = ~ok_x & ~field.blocked_arrays(keep_y)
+        out = prev.copy()
+        out[ok_x] = keep_x[ok_x]
+        out[ok_y] = keep_y[ok_y]
+        self.pos[idx] = out
+
+    def lod_split(self, target, bands, tick):
+        # Game.step_enemies_lod() on the arrays: the active rows inside the first band, and
+        # (interval, rows) for the further ones whose turn it is this tick
+        idx = np.flatnonzero(self.active)
+        d = self.pos[idx] - (target.x, target.y)
+        d2 = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+        band = np.searchsorted([b for b, k in bands], d2, side="right")
+        due = []
+        for i, (b, k) in enumerate(bands):
+            rows = idx[band == i + 1]
+            rows = rows[(tick + self.born[rows]) % k == 0]
+            if len(rows):
+                due.append((k, rows))
+        return idx[band == 0], due
+
+    def separate(self, cell_size, push, neighbours, idx=None):
+        # Game.separate_enemies() on the arrays: sort rows by cell, then compare each row with
+        # the next few rows of the same cell
+        if idx is None:
+            idx = np.flatnonzero(self.active)
+        if len(idx) < 2:
+            return
+        cells = np.floor(self.pos[idx] / cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        idx, cells = idx[order], cells[order]
+        for k in range(1, min(neighbours, len(idx) - 1) + 1):
+            same = np.all(cells[:-k] == cells[k:], axis=1)
+            a, b = idx[:-k][same], idx[k:][same]
+            d = self.pos[b] - self.pos[a]
+            dist = np.hypot(d[:, 0], d[:, 1])
+            reach = self.radius[a] + self.radius[b]
+            hit = (dist < reach) & (dist > 0)
+            if not hit.any():
+                continue
+            a, b, d, dist, reach = a[hit], b[hit], d[hit], dist[hit], reach[hit]
+            step = d * (np.minimum(push, (reach - dist) * 0.5) / dist)[:, None]
+            np.subtract.at(self.pos, a, step)
+            np.add.at(self.pos, b, step)
 
-    def draw(self, surf, cam):
-        if not self.active: return
-        p = self.pos - cam
-        pygame.draw.circle(surf, C_ENEMY, (int(p.x), int(p.y)), self.radius)
-        ratio = clamp(self.hp / self.max_hp, 0, 1)
-        if ratio < 1:
-            w = int(self.radius*2 * ratio)
-            rect = pygame.Rect(int(p.x - self.radius), int(p.y - self.radius - 8), w, 5)
-            pygame.draw.rect(surf, (80, 200, 80), rect)
-            outline = pygame.Rect(int(p.x - self.radius), int(p.y - self.radius - 8), self.radius*2, 5)
-            pygame.draw.rect(surf, (50,50,50), outline, 1)
+    def integrate(self, dt):
+        # inactive slots drift too; reset() overwrites them before reuse
+        self.pos += self.vel * dt
+
+    def decay(self, dt):
+        self.life -= dt
+        self.active &= self.life > 0
+
+def _array_field(name):
+    def get(self):
+        return getattr(self.store, name)[self.i]
+    def set(self, v):
+        getattr(self.store, name)[self.i] = v
+    return property(get, set)
+
+def _array_vec(name):
+    def get(self):
+        row = getattr(self.store, name)[self.i]
+        return vec(float(row[0]), float(row[1]))
+    def set(self, v):
+        getattr(self.store, name)[self.i] = (v[0], v[1])
+    return property(get, set)
+
+class ArrayEntity:
+    # handle onto one slot of an EntityArrays store; quacks like the object entities
+    __slots__ = ("store", "i")
+
+    def __init__(self, store, i):
+        self.store = store
+        self.i = i
+
+    pos = _array_vec("pos")
+    prev = _array_vec("prev")
+    vel = _array_vec("vel")
+    radius = _array_field("radius")
+    life = _array_field("life")
+    born = _array_field("born")
+
+    @property
+    def active(self):
+        return bool(self.store.active[self.i])
+
+    @active.setter
+    def active(self, v):
+        self.store.active[self.i] = v
+
+    def update(self, *args):
+        # stepped in bulk by EntityArrays
+        pass
+
+class ArrayProjectile(ArrayEntity):
+    __slots__ = ("speed", "damage", "max_life", "pierce")
+
+    def __init__(self, store, i):
+        super().__init__(store, i)
+        self.speed = BASE_PROJECTILE_SPEED
+        self.damage = BASE_PROJECTILE_DAMAGE
+        self.max_life = PROJECTILE_LIFE
+        self.pierce = 0
+
+    reset = Projectile.reset
+
+class ArrayXP(ArrayEntity):
+    __slots__ = ("value", "count", "parts")
+
+    def __init__(self, store, i):
+        super().__init__(store, i)
+        self.value = 1
+        self.count = 1
+        self.parts = None
+
+    reset = XP.reset
+
+class ArrayEnemy(ArrayEntity):
+    __slots__ = ("score", "xp")
+
+    def __init__(self, store, i):
+        super().__init__(store, i)
+        self.score = 1
+        self.xp = XP_PER_KILL
+
+    hp = _array_field("hp")
+    max_hp = _array_field("max_hp")
+    speed = _array_field("speed")
+
+    reset = Enemy.reset
+
+class ArrayPool:
+    # ObjectPool over EntityArrays: acquire/release map onto free slots
+    def __init__(self, cls, size, seed=None, max_size=None, overflow="grow"):
+        self.cls = cls
+        self.store = EntityArrays(size, seed)
+        self.handles = []
+        self.max_size = max_size
+        self.overflow = overflow
+        self.stamp = 0
+        self.high_water = 0
+        self.misses = 0
+        self.allocs = 0
+        self.refused = 0
+        self.recycled = 0
+        self.sync_handles()
+
+    def sync_handles(self):
+        while len(self.handles) < self.store.capacity:
+            self.handles.append(self.cls(self.store, len(self.handles)))
+
+    def acquire(self, *args, **kwargs):
+        return self.take(*args, **kwargs)[0]
+
+    def spawn(self, items, *args, **kwargs):
+        o, recycled = self.take(*args, **kwargs)
+        if o is not None and not recycled:
+            items.append(o)
+        return o
+
+    def grow(self, need):
+        # double the store (or more, to hold need slots) but stop at max_size unless overflow is "grow"
+        st = self.store
+        old = st.capacity
+        capacity = max(old * 2, need)
+        if self.max_size is not None and self.overflow != "grow":
+            capacity = min(capacity, self.max_size)
+        st.grow(capacity)
+        self.allocs += st.capacity - old
+        self.sync_handles()
+
+    def take(self, *args, **kwargs):
+        st = self.store
+        recycled = False
+        if st.free:
+            i = st.alloc()
+        else:
+            self.misses += 1
+            if self.max_size is None or st.capacity < self.max_size or self.overflow == "grow":
+                self.grow(st.capacity + 1)
+                i = st.alloc()
+            elif self.overflow == "refuse":
+                self.refused += 1
+                return None, False
+            else:
+                dead = np.flatnonzero(st.used & ~st.active)
+                i = int(dead[0]) if len(dead) else int(np.argmin(np.where(st.used, st.born, np.iinfo(np.int64).max)))
+                self.recycled += 1
+                recycled = True
+        self.stamp += 1
+        st.born[i] = self.stamp
+        o = self.handles[i]
+        o.reset(*args, **kwargs)
+        o.active = True
+        in_use = st.capacity - len(st.free)
+        if in_use > self.high_water:
+            self.high_water = in_use
+        return o, recycled
+
+    def spawn_many(self, items, specs):
+        # spawn() for each dict of reset() arguments; the store grows at most once and the slots
+        # are marked and stamped with one array write each. Misses count per spec that found the
+        # free list empty, as ObjectPool.spawn_many does; the remainder counts its own in spawn()
+        st = self.store
+        had = len(st.free)
+        short = len(specs) - had
+        if short > 0 and (self.max_size is None or st.capacity < self.max_size or self.overflow == "grow"):
+            self.grow(st.capacity + short)
+        free = st.free
+        n = min(len(specs), len(free))
+        self.misses += max(0, n - had)
+        slots = free[len(free) - n:]
+        del free[len(free) - n:]
+        slots.reverse()
+        st.used[slots] = True
+        st.active[slots] = True
+        st.born[slots] = np.arange(self.stamp + 1, self.stamp + n + 1)
+        self.stamp += n
+        handles = self.handles
+        for i, kwargs in zip(slots, specs):
+            handles[i].reset(**kwargs)
+        items.extend(handles[i] for i in slots)
+        in_use = st.capacity - len(free)
+        if in_use > self.high_water:
+            self.high_water = in_use
+        for kwargs in specs[n:]:
+            self.spawn(items, **kwargs)
+
+    def release(self, o):
+        self.store.release(o.i)
+
+    def release_all(self):
+        self.store.release_all()
+
+    @property
+    def free(self):
+        return self.store.free
+
+    def compact(self, items):
+        # free deactivated slots and rewrite items in place from the used mask
+        if not self.store.collect():
+            return
+        handles = self.handles
+        items[:] = [handles[i] for i in np.flatnonzero(self.store.used).tolist()]
+
+    def stats(self):
+        st = self.store
+        return {"size": st.capacity, "free": len(st.free), "high_water": self.high_water,
+                "misses": self.misses, "allocs": self.allocs, "refused": self.refused,
+                "recycled": self.recycled, "suggested": suggest_pool_size(self.high_water)}
+
+class ParticleSystem:
+    # hit and death effects in fixed-capacity arrays: position, velocity, life and colour index
+    # per slot. burst() only queues; step() writes the queued bursts into the next slots of a
+    # ring, so over budget the oldest particles are overwritten first, then moves every slot
+    # in one vectorized pass. Purely visual, with its own RNG
+    def __init__(self, capacity=PARTICLE_BUDGET, seed=None):
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity)
+        self.color = np.zeros(capacity, dtype=np.int64)
+        self.head = 0
+        self.pending = []
+        self.until = 0.0  # time left until every particle has expired
+        self.emitted = 0
+        self.recycled = 0
+        self.rng = np.random.default_rng(seed)
+
+    def burst(self, x, y, n, color, speed=PARTICLE_SPEED):
+        self.pending.append((x, y, n, color, speed))
+
+    def clear(self):
+        self.life[:] = 0.0
+        self.pending.clear()
+        self.until = 0.0
+
+    def emit(self):
+        xs, ys, ns, colors, speeds = zip(*self.pending)
+        self.pending.clear()
+        counts = np.array(ns)
+        total = int(counts.sum())
+        skip = max(0, total - self.capacity)  # a burst bigger than the budget keeps its newest part
+        total -= skip
+        slots = (self.head + np.arange(total)) % self.capacity
+        self.recycled += int(np.count_nonzero(self.life[slots] > 0))
+        self.emitted += total
+        self.head = (self.head + total) % self.capacity
+        rng = self.rng
+        angle = rng.uniform(0.0, 2 * math.pi, total)
+        speed = np.repeat(speeds, counts)[skip:] * rng.uniform(0.25, 1.0, total)
+        self.pos[slots] = np.repeat(np.column_stack((xs, ys)), counts, axis=0)[skip:]
+        self.vel[slots, 0] = np.cos(angle) * speed
+        self.vel[slots, 1] = np.sin(angle) * speed
+        self.life[slots] = rng.uniform(0.5, 1.0, total) * PARTICLE_LIFE
+        self.color[slots] = np.repeat(colors, counts)[skip:]
+        self.until = PARTICLE_LIFE
+
+    def step(self, dt):
+        if self.pending:
+            self.emit()
+        if self.until <= 0:
+            return
+        self.until -= dt
+        self.pos += self.vel * dt
+        self.vel *= max(0.0, 1.0 - PARTICLE_DRAG * dt)
+        self.life -= dt
+
+    def rows(self, out, bounds):
+        # (x, y, size, colour index) for each live particle inside bounds, written into out
+        if self.until <= 0:
+            out.clear()
+            return
+        x0, y0, x1, y1 = bounds
+        pos = self.pos
+        idx = np.flatnonzero((self.life > 0) & (pos[:, 0] >= x0) & (pos[:, 0] <= x1)
+                             & (pos[:, 1] >= y0) & (pos[:, 1] <= y1))
+        # 2-4 px, shrinking as the particle fades
+        size = 2 + np.minimum(self.life[idx] * (3.0 / PARTICLE_LIFE), 2.0).astype(np.int64)
+        out[:] = np.column_stack((pos[idx], size, self.color[idx])).tolist()
 
 class Player:
+    __slots__ = ("pos", "prev", "radius", "speed", "sprint_mult", "hp", "max_hp", "fire_cooldown", "fire_timer",
+                 "projectile_speed", "projectile_damage", "projectile_count", "spread_deg", "pierce", "xp",
+                 "level", "xp_to_next", "xp_boost", "kills")
+
     def __init__(self, pos):
         self.pos = vec(pos)
+        self.prev = vec(self.pos)
         self.radius = 14
         self.speed = float(PLAYER_SPEED)
         self.sprint_mult = PLAYER_SPRINT_MULT
@@ -214,28 +1766,24 @@ class Player:
         self.xp_boost = 0.0
         self.kills = 0
 
-    def update(self, dt, keys):
-        dir = vec(0,0)
-        if keys[pygame.K_w] or keys[pygame.K_UP]: dir.y -= 1
-        if keys[pygame.K_s] or keys[pygame.K_DOWN]: dir.y += 1
-        if keys[pygame.K_a] or keys[pygame.K_LEFT]: dir.x -= 1
-        if keys[pygame.K_d] or keys[pygame.K_RIGHT]: dir.x += 1
-        if dir.length() > 0:
-            dir = dir.normalize()
-        sprint = keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT]
-        spd = self.speed * (self.sprint_mult if sprint else 1.0)
-        self.pos += dir * spd * dt
-        self.pos.x = clamp(self.pos.x, -2000, 2000)
-        self.pos.y = clamp(self.pos.y, -2000, 2000)
+    def update(self, dt, inp):
+        pos = self.pos
+        self.prev.update(pos)
+        mx, my = inp.move
+        spd = self.speed * (self.sprint_mult if inp.sprint else 1.0)
+        l = math.sqrt(mx*mx + my*my)
+        if l > 0:
+            pos.x += mx / l * spd * dt
+            pos.y += my / l * spd * dt
 
         if self.fire_timer > 0:
             self.fire_timer -= dt
 
-    def try_fire(self, projectiles_pool, cam_center):
+    def try_fire(self, projectiles_pool, cam_center, aim, items):
         if self.fire_timer > 0: return []
         self.fire_timer = self.fire_cooldown
         ret = []
-        mouse_screen = vec(pygame.mouse.get_pos())
+        mouse_screen = vec(aim)
         mouse_world = mouse_screen + cam_center
         base_dir = (mouse_world - self.pos)
         if base_dir.length() == 0:
@@ -243,9 +1791,10 @@ class Player:
         base_dir = base_dir.normalize()
         n = max(1, self.projectile_count)
         if n == 1:
-            proj = projectiles_pool.acquire(pos=self.pos, direction=base_dir,
-                                            speed=self.projectile_speed, damage=self.projectile_damage)
-            ret.append(proj)
+            proj = projectiles_pool.spawn(items, pos=self.pos, direction=base_dir,
+                                          speed=self.projectile_speed, damage=self.projectile_damage)
+            if proj is not None:
+                ret.append(proj)
         else:
             spread = self.spread_deg
             mid = (n - 1) / 2.0
@@ -253,9 +1802,10 @@ class Player:
                 angle = (i - mid) * (spread / max(1, n-1))
                 rad = math.radians(angle)
                 d = base_dir.rotate_rad(rad)
-                proj = projectiles_pool.acquire(pos=self.pos, direction=d,
-                                                speed=self.projectile_speed, damage=self.projectile_damage)
-                ret.append(proj)
+                proj = projectiles_pool.spawn(items, pos=self.pos, direction=d,
+                                              speed=self.projectile_speed, damage=self.projectile_damage)
+                if proj is not None:
+                    ret.append(proj)
         return ret
 
     def gain_xp(self, amount):
@@ -264,19 +1814,23 @@ class Player:
         while self.xp >= self.xp_to_next:
             self.xp -= self.xp_to_next
             self.level += 1
-            self.xp_to_next = int(self.xp_to_next * 1.35)
+            self.xp_to_next = int(self.xp_to_next * XP_TO_LEVEL_MULT)
             leveled = True
         return leveled
 
-    def draw(self, surf, cam):
-        p = self.pos - cam
-        pygame.draw.circle(surf, C_PLAYER, (int(p.x), int(p.y)), self.radius)
-        ratio = clamp(self.hp / self.max_hp, 0, 1)
-        w = 60
-        rect = pygame.Rect(int(p.x - w/2), int(p.y + self.radius + 8), int(w*ratio), 6)
-        pygame.draw.rect(surf, (160, 60, 60), rect)
-        outline = pygame.Rect(int(p.x - w/2), int(p.y + self.radius + 8), w, 6)
-        pygame.draw.rect(surf, (40,40,40), outline, 1)
+def draw_player(surf, x, y, radius, ratio):
+    # x, y in screen coordinates; the first character sheet frame if there is one
+    frames = char_frames()
+    if frames:
+        frame = frames[0]
+        surf.blit(frame, (int(x - frame.get_width() / 2), int(y - frame.get_height() / 2)))
+    else:
+        pygame.draw.circle(surf, C_PLAYER, (int(x), int(y)), radius)
+    w = 60
+    rect = pygame.Rect(int(x - w/2), int(y + radius + 8), int(w*ratio), 6)
+    pygame.draw.rect(surf, (160, 60, 60), rect)
+    outline = pygame.Rect(int(x - w/2), int(y + radius + 8), w, 6)
+    pygame.draw.rect(surf, (40,40,40), outline, 1)
 
 def upgrade_faster_fire(pl):
     pl.fire_cooldown = max(0.05, pl.fire_cooldown * 0.80)
@@ -318,58 +1872,301 @@ UPGRADES = [
     ("XP Boost", "Gain +25% XP from kills", upgrade_xp_boost),
 ]
 
-def choose_upgrades(n=3):
-    return random.sample(UPGRADES, n)
+def choose_upgrades(n=3, rng=random):
+    return rng.sample(UPGRADES, n)
+
+spawn_tables = {}
+
+def spawn_table():
+    # the trickle's spawn times: one at 0, then ENEMY_SPAWN_INTERVAL * ENEMY_SPAWN_ACCEL ** (t / 10)
+    # apart until that reaches ENEMY_SPAWN_MIN_INTERVAL or SPAWN_TABLE_HORIZON passes. Returns
+    # (times, spacing after the last); cached per tuning since batch.py --set can change it
+    key = (ENEMY_SPAWN_INTERVAL, ENEMY_SPAWN_ACCEL, ENEMY_SPAWN_MIN_INTERVAL)
+    table = spawn_tables.get(key)
+    if table is None:
+        times = array("d")
+        t = 0.0
+        while True:
+            times.append(t)
+            interval = ENEMY_SPAWN_INTERVAL * (ENEMY_SPAWN_ACCEL ** (t / 10.0))
+            if interval <= ENEMY_SPAWN_MIN_INTERVAL or t > SPAWN_TABLE_HORIZON:
+                break
+            t += interval
+        table = spawn_tables[key] = (times, max(ENEMY_SPAWN_MIN_INTERVAL, interval))
+    return table
+
+def load_spawn_data(path):
+    # (waves, enemy types) from a JSON file shaped like
+    #   {"enemies": {"name": {"hp": 1.0, "speed": 1.0, "radius": 12, "xp": 1}, ...},
+    #    "waves": [{"at": 60, "every": 60, "shape": "burst", "count": 8, "enemy": "name"}, ...]}
+    # enemies add to or replace ENEMY_TYPES; leaving out "waves" keeps WAVES
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+
+    def number(value, what):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}: {what} must be a number, got {value!r}") from None
+
+    def whole(value, what):
+        value = number(value, what)
+        if not value.is_integer():
+            raise ValueError(f"{path}: {what} must be a whole number, got {value}")
+        return int(value)
+
+    types = dict(ENEMY_TYPES)
+    for name, t in data.get("enemies", {}).items():
+        kind = (number(t.get("hp", 1.0), f"enemy type {name!r} hp"),
+                number(t.get("speed", 1.0), f"enemy type {name!r} speed"),
+                whole(t.get("radius", 12), f"enemy type {name!r} radius"), whole(t.get("xp", 1), f"enemy type {name!r} xp"))
+        if not kind[0] > 0:
+            raise ValueError(f"{path}: enemy type {name!r} hp must be positive, got {kind[0]}")
+        if kind[1] < 0:
+            raise ValueError(f"{path}: enemy type {name!r} speed must not be negative, got {kind[1]}")
+        if kind[2] < 1:
+            raise ValueError(f"{path}: enemy type {name!r} radius must be at least 1, got {kind[2]}")
+        if kind[3] < 1:
+            raise ValueError(f"{path}: enemy type {name!r} xp must be at least 1, got {kind[3]}")
+        types[name] = kind
+    if "waves" not in data:
+        return WAVES, types
+    waves = []
+    for i, w in enumerate(data["waves"]):
+        if not isinstance(w, dict) or "at" not in w:
+            raise ValueError(f"{path}: wave {i} needs an \"at\" time")
+        wave = (number(w["at"], "wave at"), number(w.get("every", 0), "wave every"), w.get("shape", "edge"),
+                whole(w.get("count", 1), "wave count"), w.get("enemy", TRICKLE_TYPE))
+        if wave[0] < 0 or wave[1] < 0:
+            raise ValueError(f"{path}: wave times must not be negative (at {wave[0]}, every {wave[1]})")
+        if wave[3] < 1:
+            raise ValueError(f"{path}: wave count must be at least 1, got {wave[3]}")
+        if wave[2] not in WAVE_SHAPES:
+            raise ValueError(f"{path}: unknown wave shape {wave[2]!r}, expected one of {', '.join(WAVE_SHAPES)}")
+        if wave[4] not in types:
+            raise ValueError(f"{path}: unknown enemy type {wave[4]!r}")
+        waves.append(wave)
+    return tuple(waves), types
 
 class SpawnSystem:
-    def __init__(self):
-        self.timer = 0.0
-        self.interval = ENEMY_SPAWN_INTERVAL
+    # spawns on a timetable of game time rather than per tick: the trickle at spawn_table() times
+    # plus the waves, all compared against the clock, so a long tick still gets every spawn it
+    # owes, in one batch. Spawns that come due at max_enemies are dropped, not held back
+    def __init__(self, waves=WAVES, enemy_types=ENEMY_TYPES):
+        self.waves = waves
+        self.types = enemy_types
+        self.times, self.tail = spawn_table()
         self.time_elapsed = 0.0
+        self.max_enemies = MAX_ENEMIES
+        self.spawned = 0
+        self.dropped = 0
+        self.trickle = 0  # trickle spawns done
+        self.rounds = [0] * len(waves)  # times each wave has come
+        self.next_due = 0.0
+        self.due = []
+
+    def trickle_time(self, k):
+        times = self.times
+        if k < len(times):
+            return times[k]
+        return times[-1] + (k - len(times) + 1) * self.tail
+
+    def wave_time(self, w, j):
+        at, every = self.waves[w][:2]
+        if j and not every:
+            return math.inf
+        return at + j * every
+
+    def seek(self, t):
+        # put the clock at t with everything due by then done, as update() would have left it
+        self.time_elapsed = t
+        now = t + SPAWN_EPSILON
+        k = bisect.bisect_right(self.times, now)
+        if k == len(self.times):
+            k += max(0, int((t - self.times[-1]) / self.tail) - 1)
+        while self.trickle_time(k) <= now:
+            k += 1
+        self.trickle = k
+        for w, wave in enumerate(self.waves):
+            at, every = wave[:2]
+            j = max(0, int((t - at) / every) - 1) if every and t > at else 0
+            while self.wave_time(w, j) <= now:
+                j += 1
+            self.rounds[w] = j
+        self.next_due = min([self.trickle_time(k)] + [self.wave_time(w, j) for w, j in enumerate(self.rounds)])
 
     def update(self, dt, game):
-        if len(game.enemies) >= MAX_ENEMIES:
-            return
-        self.timer -= dt
         self.time_elapsed += dt
-        if self.timer <= 0:
-            self.spawn_enemy(game)
-            self.interval = max(0.12, ENEMY_SPAWN_INTERVAL * (0.98 ** (self.time_elapsed / 10.0)))
-            self.timer = self.interval
-
-    def spawn_enemy(self, game):
-        pos = rand_edge_pos(margin=24) + game.cam_world_offset()
-        difficulty_multiplier = 1.0 + (self.time_elapsed / 60.0)  
-        e = game.enemy_pool.acquire(
-            pos=pos,
-            hp=int(ENEMY_BASE_HP * difficulty_multiplier),
-            speed=ENEMY_BASE_SPEED * difficulty_multiplier,
-            radius=12
-        )
-        game.enemies.append(e)
+        now = self.time_elapsed + SPAWN_EPSILON
+        if now < self.next_due:
+            return
+        due = self.due
+        t = self.trickle_time(self.trickle)
+        while t <= now:
+            due.append((t, -1))
+            self.trickle += 1
+            t = self.trickle_time(self.trickle)
+        next_due = t
+        rounds = self.rounds
+        for w in range(len(rounds)):
+            t = self.wave_time(w, rounds[w])
+            while t <= now:
+                due.append((t, w))
+                rounds[w] += 1
+                t = self.wave_time(w, rounds[w])
+            next_due = min(next_due, t)
+        self.next_due = next_due
+        due.sort()
+        self.spawn_batch(game, due)
+        due.clear()
+
+    def spawn_batch(self, game, due):
+        # one enemy_pool.spawn_many() for everything in due, as (scheduled time, wave or -1 for the trickle)
+        room = self.max_enemies - len(game.enemies)
+        rng = game.rng
+        center = game.cam_world_offset()
+        specs = []
+        for t, w in due:
+            if w < 0:
+                shape, count, kind = "edge", 1, TRICKLE_TYPE
+            else:
+                shape, count, kind = self.waves[w][2:]
+            hp_mult, speed_mult, radius, xp_mult = self.types[kind]
+            # difficulty follows the scheduled time, not the tick the spawn landed on
+            difficulty_multiplier = 1.0 + (t / ENEMY_DIFFICULTY_RAMP)
+            hp = max(1, int(ENEMY_BASE_HP * difficulty_multiplier * hp_mult))
+            speed = ENEMY_BASE_SPEED * difficulty_multiplier * speed_mult
+            for pos in self.place(shape, count, center, rng):
+                if len(specs) >= room or game.field.blocked(pos.x, pos.y):
+                    self.dropped += 1
+                    continue
+                specs.append({"pos": pos, "hp": hp, "speed": speed, "radius": radius,
+                              "score": xp_mult, "xp": XP_PER_KILL * xp_mult})
+        if specs:
+            game.enemy_pool.spawn_many(game.enemies, specs)
+            self.spawned += len(specs)
+
+    def place(self, shape, count, center, rng):
+        if shape == "edge":
+            return [rand_edge_pos(margin=24, rng=rng) + center for _ in range(count)]
+        if shape == "burst":
+            at = rand_edge_pos(margin=24, rng=rng) + center
+            out = []
+            for _ in range(count):
+                a = rng.uniform(0, math.tau)
+                r = SPAWN_BURST_RADIUS * math.sqrt(rng.random())
+                out.append(at + vec(math.cos(a) * r, math.sin(a) * r))
+            return out
+        # ring: evenly round the player, just past the screen corners
+        r = math.hypot(SCREEN_W, SCREEN_H) / 2 + SPAWN_RING_MARGIN
+        a0 = rng.uniform(0, math.tau)
+        out = []
+        for i in range(count):
+            a = a0 + math.tau * i / count
+            out.append(center + vec(math.cos(a) * r, math.sin(a) * r))
+        return out
+
+class RenderSnapshot:
+    # everything draw_snapshot() needs for one tick, copied out of the Game so the renderer never
+    # reads live entities. layers holds one list per LAYER_COLORS entry of culled
+    # (x, y, prev x, prev y, radius, hp ratio) rows, particles ParticleSystem.rows(); hud is
+    # (seconds, level, xp, xp to next, kills, enemies)
+    __slots__ = ("version", "tick_time", "input_sampled", "pos", "prev", "radius", "hp_ratio", "hud", "layers",
+                 "particles", "paused", "show_levelup", "game_over", "levelup_options", "static")
 
-class Game:
     def __init__(self):
+        self.version = 0
+        self.tick_time = 0.0
+        self.input_sampled = 0.0
+        self.pos = self.prev = (0.0, 0.0)
+        self.radius = 14
+        self.hp_ratio = 1.0
+        self.hud = (0, 1, 0, XP_TO_LEVEL_BASE, 0, 0)
+        self.layers = ([], [], [])
+        self.particles = []
+        self.paused = self.show_levelup = self.game_over = self.static = False
+        self.levelup_options = []
+
+class Game:
+    def __init__(self, array_store=False, seed=None, input_source=None, obstacles=(), lod=True, spawn_data=None):
+        self.array_store = array_store and np is not None
+        self.field = FlowField(obstacles)
+        # (waves, enemy types) for the SpawnSystem, as load_spawn_data() returns them
+        self.spawn_data = spawn_data if spawn_data is not None else (WAVES, ENEMY_TYPES)
+        # LOD_BANDS with squared distances, or None for full detail everywhere
+        self.lod = [(d * d, k) for d, k in LOD_BANDS] if lod else None
+        self.lod_reach = None
+        self.lod_widened = self.lod
+        self.near_enemies = []
+        self.near_rows = None
+        self.far_enemies = 0
+        self.rng = random.Random(seed)
+        self.input = input_source if input_source is not None else PygameInput()
+        self.prof = NullProfiler()
+        self.make_pools()
+        self.sprites = SpriteCache()
+        self.texts = TextCache()
+        self.show_profiler = False
+        self.keep_profiler = False
+        self.recorder = None
+        self.quicksave = None
+        self.view = RenderSnapshot()
+        self.input_sampled = 0.0
+        # created by the first draw, so headless games never render ground or effects; both
+        # are purely visual and seeded apart from the game RNG
+        self.ground = None
+        self.particles = None
+        self.render_seed = seed if seed is not None else random.getrandbits(32)
         self.reset()
 
+    def make_pools(self):
+        # pools live as long as the Game; reset() hands everything back with release_all()
+        if self.array_store:
+            self.projectile_pool = ArrayPool(ArrayProjectile, POOL_PROJECTILES,
+                                             max_size=POOL_PROJECTILES_MAX, overflow=POOL_PROJECTILES_OVERFLOW)
+            self.xp_pool = ArrayPool(ArrayXP, POOL_XP, max_size=POOL_XP_MAX, overflow=POOL_XP_OVERFLOW)
+            self.enemy_pool = ArrayPool(ArrayEnemy, POOL_ENEMIES, seed=self.rng.getrandbits(64),
+                                        max_size=POOL_ENEMIES_MAX, overflow=POOL_ENEMIES_OVERFLOW)
+        else:
+            self.projectile_pool = ObjectPool(Projectile, POOL_PROJECTILES,
+                                              max_size=POOL_PROJECTILES_MAX, overflow=POOL_PROJECTILES_OVERFLOW)
+            self.xp_pool = ObjectPool(XP, POOL_XP, max_size=POOL_XP_MAX, overflow=POOL_XP_OVERFLOW)
+            self.enemy_pool = ObjectPool(Enemy, POOL_ENEMIES, max_size=POOL_ENEMIES_MAX, overflow=POOL_ENEMIES_OVERFLOW)
+
+    def pool_stats(self):
+        return {"projectiles": self.projectile_pool.stats(), "xp": self.xp_pool.stats(),
+                "enemies": self.enemy_pool.stats()}
+
     def reset(self):
         self.player = Player(vec(0,0))
-        self.projectile_pool = ObjectPool(Projectile, POOL_PROJECTILES)
-        self.xp_pool = ObjectPool(XP, POOL_XP)
-        self.enemy_pool = ObjectPool(Enemy, POOL_ENEMIES)
+        self.projectile_pool.release_all()
+        self.xp_pool.release_all()
+        self.enemy_pool.release_all()
         self.projectiles = []
         self.xps = []
         self.enemies = []
-        self.spawn = SpawnSystem()
+        self.enemy_grid = SpatialHash()
+        self.xp_grid = SpatialHash()
+        self.spawn = SpawnSystem(*self.spawn_data)
         self.elapsed = 0.0
+        self.ticks = 0
         self.running = True
         self.paused = False
         self.game_over = False
         self.cam = vec(0,0) 
         self.level_up_pending = False
         self.levelup_options = []
+        self.upgrade_log = []
         self.show_levelup = False
+        self.levelup_panel = None
+        self.static_key = None
         self.best_time = 0.0
+        self.field.reset()
+        if self.particles is not None:
+            self.particles.clear()
 
     def cam_world_offset(self):
         return self.player.pos
@@ -378,94 +2175,479 @@ class Game:
         return pos - self.cam
 
     def update_cam(self):
-        self.cam = self.player.pos - vec(SCREEN_W/2, SCREEN_H/2)
+        pos = self.player.pos
+        cam = self.cam
+        cam.update(pos.x - SCREEN_W/2, pos.y - SCREEN_H/2)
+        if self.ground is not None:
+            # the view plus where this tick's movement leads over the next CHUNK_LOOKAHEAD ticks
+            prev = self.player.prev
+            ax = (pos.x - prev.x) * CHUNK_LOOKAHEAD
+            ay = (pos.y - prev.y) * CHUNK_LOOKAHEAD
+            self.ground.prefetch(cam.x + min(ax, 0) - CULL_MARGIN, cam.y + min(ay, 0) - CULL_MARGIN,
+                                 cam.x + SCREEN_W + max(ax, 0) + CULL_MARGIN,
+                                 cam.y + SCREEN_H + max(ay, 0) + CULL_MARGIN)
 
     def spawn_xp(self, pos, value=1):
-        xp = self.xp_pool.acquire(pos=pos, value=value)
-        self.xps.append(xp)
+        # stack onto a nearby orb of the same value; at the live cap, onto the nearest orb of any
+        # value, keeping a different value as its own part so the boosted award matches separate pickups.
+        # The orb keeps its own life: refreshing it would let an orb that keeps absorbing drops live forever
+        for x in self.xp_grid.hits(pos, XP_MERGE_RADIUS):
+            if x.value == value:
+                x.count += 1
+                return x
+        if len(self.xps) >= XP_MAX_LIVE:
+            live = [x for x in self.xps if x.active]
+            if live:
+                x = min(live, key=lambda x: (x.value != value, (x.pos - pos).length_squared()))
+                if x.value == value:
+                    x.count += 1
+                else:
+                    if x.parts is None:
+                        x.parts = {}
+                    x.parts[value] = x.parts.get(value, 0) + 1
+                return x
+        xp = self.xp_pool.spawn(self.xps, pos=pos, value=value)
+        if xp is None:
+            return None
+        if self.array_store:
+            self.xp_grid.items = self.xp_pool.handles
+            self.xp_grid.add(xp.i, xp)
+        else:
+            self.xp_grid.insert(xp)
+        return xp
 
     def update(self, dt, events):
-        if self.paused or self.show_levelup:
+        if self.paused or self.game_over:
             return
-        if self.game_over:
-            return
-
-        keys = pygame.key.get_pressed()
-        self.player.update(dt, keys)
+        inp = self.input.read(self)
+        self.input_sampled = inp.sampled
+        if self.recorder is not None:
+            self.recorder.record_tick(inp)
+        if self.show_levelup:
+            # scripted and headless inputs pick upgrades themselves; players use the 1-3 keys
+            if inp.pick is not None:
+                self.apply_upgrade(inp.pick)
+            if self.show_levelup:
+                return
+
+        prof = self.prof
+        prof.start()
+        self.static_key = None
+        self.player.update(dt, inp)
+        if self.field.obstacles:
+            self.field.collide(self.player)
         self.update_cam()
         self.elapsed += dt
+        self.ticks += 1
+        prof.lap("player")
         self.spawn.update(dt, self)
+        prof.lap("spawn")
+
+        if self.array_store:
+            self.step_arrays(dt)
+        else:
+            self.step_objects(dt)
+
+        self.rebuild_grids()
+        self.separate_enemies(dt)
+
+        for e in self.enemy_grid.hits(self.player.pos, self.player.radius):
+            self.player.hp -= 12 * dt  
+            if self.player.hp <= 0:
+                self.player.hp = 0
+                self.game_over = True
+                self.running = False
+                self.best_time = max(self.best_time, self.elapsed)
+        prof.lap("collision")
+
+        self.pull_xp(dt)
+        for x in self.xp_grid.hits(self.player.pos, self.player.radius):
+            mult = 1.0 + self.player.xp_boost
+            gained = int(x.value * mult) * x.count
+            if x.parts:
+                gained += sum(int(v * mult) * c for v, c in x.parts.items())
+            leveled = self.player.gain_xp(gained)
+            if leveled:
+                self.open_levelup()
+            x.active = False
+        prof.lap("xp")
+
+        self.resolve_projectile_hits(dt)
+        prof.lap("collision")
+        fired = []
+        if self.player.fire_timer <= 0 and not self.show_levelup:
+            newproj = self.player.try_fire(self.projectile_pool, self.cam, inp.aim, self.projectiles)
+            for pr in newproj:
+                pr.pierce = self.player.pierce
+        prof.lap("projectiles")
 
-        for p in list(self.projectiles):
+        if self.particles is not None:
+            self.particles.step(dt)
+            prof.lap("effects")
+
+        
+
+    def step_objects(self, dt):
+        prof = self.prof
+        for p in self.projectiles:
             p.update(dt)
-            if not p.active:
-                self.projectile_pool.release(p)
-                self.projectiles.remove(p)
-
-        for e in list(self.enemies):
-            if not e.active:
-                self.enemy_pool.release(e)
-                self.enemies.remove(e)
-                continue
-            e.update(dt, self.player.pos)
-            if (e.pos - self.player.pos).length() <= (e.radius + self.player.radius):
-                
-                self.player.hp -= 12 * dt  
-                if self.player.hp <= 0:
-                    self.player.hp = 0
-                    self.game_over = True
-                    self.running = False
-                    self.best_time = max(self.best_time, self.elapsed)
-           
-
-        for x in list(self.xps):
+        self.projectile_pool.compact(self.projectiles)
+        prof.lap("projectiles")
+
+        self.enemy_pool.compact(self.enemies)
+        field = self.field
+        field.update(self.player.pos)
+        if self.lod is not None:
+            self.step_enemies_lod(dt)
+        else:
+            for e in self.enemies:
+                e.update(dt, self.player.pos, self.rng, field)
+        prof.lap("enemies")
+
+        for x in self.xps:
             x.update(dt)
-            if not x.active:
-                self.xp_pool.release(x)
-                self.xps.remove(x)
+        self.xp_pool.compact(self.xps)
+        prof.lap("xp")
+
+    def lod_bands(self):
+        # self.lod with the first band at least as far out as a shot can fly, plus a cell of
+        # slack for radii; far enemies are not in the grid, so shots would pass through them
+        reach = self.player.projectile_speed * PROJECTILE_LIFE + SPATIAL_CELL
+        if reach != self.lod_reach:
+            self.lod_reach = reach
+            r2 = reach * reach
+            bands = self.lod
+            if r2 <= bands[0][0]:
+                self.lod_widened = bands
+            else:
+                self.lod_widened = [(r2, bands[0][1])] + [(b, k) for b, k in bands[1:] if b > r2]
+        return self.lod_widened
+
+    def step_enemies_lod(self, dt):
+        # enemies inside the first LOD band get the full update; further out they move every
+        # interval ticks by interval*dt without jitter, staggered by spawn stamp, and are left
+        # out of the enemy grid (contact, hits, separation) until they close in again
+        ppos = self.player.pos
+        px, py = ppos.x, ppos.y
+        bands = self.lod_bands()
+        near2 = bands[0][0]
+        rng, field, tick = self.rng, self.field, self.ticks
+        near = self.near_enemies
+        near.clear()
+        for e in self.enemies:
+            if not e.active: continue
+            p = e.pos
+            dx = p.x - px
+            dy = p.y - py
+            d2 = dx*dx + dy*dy
+            if d2 < near2:
+                e.update(dt, ppos, rng, field)
+                near.append(e)
                 continue
-            if (x.pos - self.player.pos).length() <= (x.radius + self.player.radius):
-                gained = x.value
-                boost = getattr(self.player, "xp_boost", 0.0)
-                gained = int(gained * (1.0 + boost))
-                leveled = self.player.gain_xp(gained)
-                if leveled:
-                    self.open_levelup()
-                self.xp_pool.release(x)
-                self.xps.remove(x)
-
-        for p in list(self.projectiles):
+            for b, k in bands:
+                if d2 < b:
+                    break
+                interval = k
+            if (tick + e.born) % interval == 0:
+                e.update(dt * interval, ppos, rng, field, 0)
+        self.far_enemies = len(self.enemies) - len(near)
+
+    def step_arrays(self, dt):
+        # one vectorized pass per entity kind instead of per-object update()
+        prof = self.prof
+        pp, ep, xp = self.projectile_pool, self.enemy_pool, self.xp_pool
+        pp.store.save_prev()
+        pp.store.integrate(dt)
+        pp.store.decay(dt)
+        pp.compact(self.projectiles)
+        prof.lap("projectiles")
+
+        ep.compact(self.enemies)
+        ep.store.save_prev()
+        self.field.update(self.player.pos)
+        if self.lod is not None:
+            near, due = ep.store.lod_split(self.player.pos, self.lod_bands(), self.ticks)
+            ep.store.seek(self.player.pos, dt, field=self.field, idx=near)
+            for k, rows in due:
+                ep.store.seek(self.player.pos, dt * k, 0, self.field, rows)
+            self.near_rows = near
+            self.far_enemies = len(self.enemies) - len(near)
+        else:
+            ep.store.seek(self.player.pos, dt, field=self.field)
+        prof.lap("enemies")
+
+        xp.store.save_prev()
+        xp.store.decay(dt)
+        xp.compact(self.xps)
+        prof.lap("xp")
+
+    def pull_xp(self, dt):
+        # orbs inside the magnet radius drift to the player; found via the grid, not a scan
+        ppos = self.player.pos
+        step = XP_MAGNET_SPEED * dt
+        for x in self.xp_grid.hits(ppos, XP_MAGNET_RADIUS):
+            d = ppos - x.pos
+            dist = d.length()
+            if dist > step:
+                x.pos += d * (step / dist)
+            else:
+                x.pos = vec(ppos)
+
+    def separate_enemies(self, dt):
+        # push overlapping enemies apart so the horde spreads out instead of stacking on the
+        # player; each enemy only checks the next few entries of its own grid bucket
+        push = SEPARATION_SPEED * dt
+        grid = self.enemy_grid
+        if self.array_store:
+            self.enemy_pool.store.separate(grid.cell_size, push, SEPARATION_NEIGHBOURS,
+                                           self.near_rows if self.lod is not None else None)
+            return
+        items, cells = grid.items, grid.cells
+        for key in grid.filled:
+            bucket = cells[key]
+            n = len(bucket)
+            for a in range(n - 1):
+                ea = items[bucket[a]]
+                pa = ea.pos
+                for b in range(a + 1, min(n, a + 1 + SEPARATION_NEIGHBOURS)):
+                    eb = items[bucket[b]]
+                    pb = eb.pos
+                    dx = pb.x - pa.x
+                    dy = pb.y - pa.y
+                    d2 = dx*dx + dy*dy
+                    reach = ea.radius + eb.radius
+                    if d2 >= reach*reach or d2 == 0:
+                        continue
+                    d = math.sqrt(d2)
+                    k = min(push, (reach - d) * 0.5) / d
+                    pa.x -= dx * k
+                    pa.y -= dy * k
+                    pb.x += dx * k
+                    pb.y += dy * k
+
+    def rebuild_grids(self):
+        # with LOD only the near enemies are bucketed
+        lod = self.lod is not None
+        if self.array_store:
+            self.enemy_grid.rebuild_arrays(self.enemy_pool.store, self.enemy_pool.handles,
+                                           self.near_rows if lod else None)
+            self.xp_grid.rebuild_arrays(self.xp_pool.store, self.xp_pool.handles)
+        else:
+            self.enemy_grid.rebuild(self.near_enemies if lod else self.enemies)
+            self.xp_grid.rebuild(self.xps)
+
+    def resolve_projectile_hits(self, dt=0.0):
+        # swept test: the projectile's move this tick against each enemy's, both straight lines, so a
+        # fast shot or a long tick cannot skip past an enemy. An enemy counts when the projectile
+        # enters it, nearest first along the path, so pierce passes through each enemy once and the
+        # hits come out the same at any tick rate
+        grid = self.enemy_grid
+        items = grid.items
+        fx = self.particles
+        hits = []
+        for p in self.projectiles:
             if not p.active: continue
-            for e in list(self.enemies):
+            pos, prev = p.pos, p.prev
+            ax, ay, bx, by, pr = prev.x, prev.y, pos.x, pos.y, p.radius
+            # a shot on its first move may start inside an enemy; later ones were tested there last tick
+            fresh = p.max_life - p.life <= dt * 1.5
+            last_er = r2 = None
+            # enemies are bucketed at the end of their move, so reach back over the longest one
+            pad = pr + grid.max_move
+            for i in grid.query_box(min(ax, bx) - pad, min(ay, by) - pad, max(ax, bx) + pad, max(ay, by) + pad):
+                e = items[i]
                 if not e.active: continue
-                if (p.pos - e.pos).length() <= (p.radius + e.radius):
-                    e.hp -= p.damage
-                    if getattr(p, "pierce", 0) <= 0:
-                        p.active = False
-                    else:
-                        p.pierce = getattr(p, "pierce", 0) - 1
-                    if e.hp <= 0:
-                        e.active = False
-                        self.player.kills += 1
-                        self.spawn_xp(e.pos, value=e.xp)
-                    break  
-        fired = []
-        if self.player.fire_timer <= 0 and not self.show_levelup:
-            newproj = self.player.try_fire(self.projectile_pool, self.cam)
-            for pr in newproj:
-                pr.pierce = getattr(self.player, "pierce", 0)
-                self.projectiles.append(pr)
+                ep, eq = e.pos, e.prev
+                # the projectile as seen from the enemy: starts at s, moves by m
+                sx = ax - eq.x
+                sy = ay - eq.y
+                mx = bx - ep.x - sx
+                my = by - ep.y - sy
+                # enemies mostly share a radius, so the squared reach is recomputed only when it changes
+                er = e.radius
+                if er != last_er:
+                    last_er = er
+                    r2 = (pr + er) * (pr + er)
+                c = sx*sx + sy*sy - r2
+                if c <= 0:
+                    if fresh:
+                        hits.append((0.0, i))
+                    continue
+                b = sx*mx + sy*my
+                if b >= 0: continue
+                a = mx*mx + my*my
+                disc = b*b - a*c
+                if disc < 0: continue
+                t = (-b - math.sqrt(disc)) / a
+                if t <= 1.0:
+                    hits.append((t, i))
+            if not hits: continue
+            if len(hits) > 1:
+                hits.sort()
+            for t, i in hits:
+                e = items[i]
+                e.hp -= p.damage
+                if p.pierce <= 0:
+                    p.active = False
+                else:
+                    p.pierce -= 1
+                if e.hp <= 0:
+                    e.active = False
+                    self.player.kills += 1
+                    self.spawn_xp(e.pos, value=e.xp)
+                    if fx is not None:
+                        ep = e.pos
+                        fx.burst(ep.x, ep.y, PARTICLES_KILL, FX_KILL)
+                elif fx is not None:
+                    fx.burst(ax + (bx - ax) * t, ay + (by - ay) * t, PARTICLES_HIT, FX_HIT)
+                if not p.active:
+                    break
+            hits.clear()
+
+    def digest(self):
+        # hash of the simulation state; equal digests mean bit-identical runs
+        pl = self.player
+        vals = [self.elapsed, pl.pos.x, pl.pos.y, pl.hp, pl.xp, pl.level, pl.kills, pl.fire_timer,
+                self.spawn.spawned, self.spawn.time_elapsed]
+        for group in (self.enemies, self.projectiles, self.xps):
+            vals.append(len(group))
+            for o in group:
+                vals.extend((o.pos.x, o.pos.y, o.active))
+        for e in self.enemies:
+            vals.append(e.hp)
+        return hashlib.sha1(struct.pack(f"<{len(vals)}d", *vals)).hexdigest()
+
+    def snapshot(self):
+        # the whole simulation state as bytes; restore() brings it back bit for bit
+        pl, sp = self.player, self.spawn
+        ep = self.enemy_pool
+        np_rng = self.array_store and ep.store.rng.bit_generator.state["bit_generator"] == "PCG64"
+        out = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, int(self.array_store) | int(np_rng) << 1),
+               SNAPSHOT_GAME.pack(self.elapsed, self.best_time, sp.time_elapsed, sp.max_enemies, sp.spawned,
+                                  sp.dropped, self.ticks, self.running, self.paused, self.game_over, self.show_levelup,
+                                  self.level_up_pending),
+               SNAPSHOT_PLAYER_STRUCT.pack(pl.pos.x, pl.pos.y, pl.prev.x, pl.prev.y,
+                                           *(getattr(pl, name) for name, _ in SNAPSHOT_PLAYER))]
+        version, mt, gauss = self.rng.getstate()
+        out.append(SNAPSHOT_RNG.pack(*mt, math.nan if gauss is None else gauss))
+        if np_rng:
+            st = ep.store.rng.bit_generator.state
+            out.append(SNAPSHOT_NP_RNG.pack(st["state"]["state"].to_bytes(16, "little"),
+                                            st["state"]["inc"].to_bytes(16, "little"),
+                                            st["has_uint32"], st["uinteger"]))
+        names = [u[0] for u in UPGRADES]
+        picks = bytes(UPGRADES.index(o) for o in self.levelup_options)
+        log = bytes(names.index(n) for n in self.upgrade_log)
+        out += [SNAPSHOT_UPGRADES.pack(len(picks), len(log)), picks, log]
+        for kind, pool, items in self.entity_groups():
+            out.append(SNAPSHOT_COUNTS.pack(len(items), pool.stamp))
+            out.append(pack_entities(pool, items, SNAPSHOT_COLUMNS[kind]))
+            if self.array_store:
+                free = np.array(pool.store.free, dtype=np.int64)
+                out += [SNAPSHOT_FREE.pack(pool.store.capacity, len(free)), free.tobytes()]
+        parts = array("q")
+        for i, x in enumerate(self.xps):
+            if x.parts:
+                for v, c in x.parts.items():
+                    parts.extend((i, v, c))
+        out += [SNAPSHOT_XP_PARTS.pack(len(parts) // 3), parts.tobytes()]
+        field = self.field
+        goal = field.goal or (0, 0)
+        pending = field.pending[0] if field.pending is not None else (0, 0)
+        out.append(SNAPSHOT_FIELD.pack(field.goal is not None, *goal, field.pending is not None, *pending,
+                                       field.progress))
+        return b"".join(out)
+
+    def restore(self, data):
+        check_snapshot(data)
+        magic, flags = SNAPSHOT_HEADER.unpack_from(data)
+        pos = SNAPSHOT_HEADER.size
+
+        def take(st):
+            nonlocal pos
+            vals = st.unpack_from(data, pos)
+            pos += st.size
+            return vals
 
-        
+        self.reset()
+        pl, sp = self.player, self.spawn
+        (self.elapsed, self.best_time, t, sp.max_enemies, sp.spawned, sp.dropped, self.ticks,
+         self.running, self.paused, self.game_over, self.show_levelup, self.level_up_pending) = take(SNAPSHOT_GAME)
+        sp.seek(t)
+        vals = take(SNAPSHOT_PLAYER_STRUCT)
+        pl.pos.update(vals[0], vals[1])
+        pl.prev.update(vals[2], vals[3])
+        for (name, _), v in zip(SNAPSHOT_PLAYER, vals[4:]):
+            setattr(pl, name, v)
+        vals = take(SNAPSHOT_RNG)
+        self.rng.setstate((3, vals[:625], None if math.isnan(vals[625]) else vals[625]))
+        if flags & 2:
+            state, inc, has_uint32, uinteger = take(SNAPSHOT_NP_RNG)
+            if self.array_store:
+                self.enemy_pool.store.rng.bit_generator.state = {
+                    "bit_generator": "PCG64",
+                    "state": {"state": int.from_bytes(state, "little"), "inc": int.from_bytes(inc, "little")},
+                    "has_uint32": has_uint32, "uinteger": uinteger}
+        n_picks, n_log = take(SNAPSHOT_UPGRADES)
+        self.levelup_options = [UPGRADES[i] for i in data[pos:pos + n_picks]]
+        pos += n_picks
+        self.upgrade_log = [UPGRADES[i][0] for i in data[pos:pos + n_log]]
+        pos += n_log
+        for kind, pool, items in self.entity_groups():
+            fields = SNAPSHOT_COLUMNS[kind]
+            n, stamp = take(SNAPSHOT_COUNTS)
+            size = n * snapshot_width(fields) * 8
+            rows = data[pos:pos + size]
+            pos += size
+            slots = free = None
+            if flags & 1:
+                slots = data[pos:pos + n * 8]
+                pos += n * 8
+                capacity, n_free = take(SNAPSHOT_FREE)
+                free = data[pos:pos + n_free * 8]
+                pos += n_free * 8
+                if self.array_store:
+                    slots = np.frombuffer(slots, dtype=np.int64)
+                    if pool.store.capacity < capacity:
+                        pool.store.grow(capacity)
+                        pool.sync_handles()
+                    free = np.frombuffer(free, dtype=np.int64).tolist()
+            if not self.array_store:
+                slots = free = None
+            unpack_entities(pool, items, fields, rows, n, slots, free)
+            pool.stamp = stamp
+        for x in self.xps:
+            x.parts = None
+        n, = take(SNAPSHOT_XP_PARTS)
+        parts = array("q")
+        parts.frombytes(data[pos:pos + n * 24])
+        pos += n * 24
+        for r in range(0, len(parts), 3):
+            x = self.xps[parts[r]]
+            if x.parts is None:
+                x.parts = {}
+            x.parts[parts[r + 1]] = parts[r + 2]
+        has_goal, gx, gy, has_pending, px, py, progress = take(SNAPSHOT_FIELD)
+        self.field.seek((gx, gy) if has_goal else None, (px, py) if has_pending else None, progress)
+        self.update_cam()
+
+    def entity_groups(self):
+        return (("enemies", self.enemy_pool, self.enemies),
+                ("projectiles", self.projectile_pool, self.projectiles),
+                ("xps", self.xp_pool, self.xps))
 
     def open_levelup(self):
         self.show_levelup = True
-        self.levelup_options = choose_upgrades(3)
+        self.levelup_options = choose_upgrades(3, self.rng)
+        if self.particles is not None:
+            pos = self.player.pos
+            self.particles.burst(pos.x, pos.y, PARTICLES_LEVELUP, FX_LEVELUP, PARTICLE_SPEED * 2)
 
     def apply_upgrade(self, index):
         if not self.show_levelup: return
         if index < 0 or index >= len(self.levelup_options): return
         name, desc, func = self.levelup_options[index]
+        self.upgrade_log.append(name)
         try:
             func(self.player)
         except Exception as ex:
@@ -481,78 +2663,435 @@ class Game:
         self.player.hp = int(clamp(self.player.hp, 0, self.player.max_hp))
         self.show_levelup = False
 
-    def draw(self, surf):
-        surf.fill(C_BG)
-
-        for x in self.xps:
-            x.draw(surf, self.cam)
-        for e in self.enemies:
-            e.draw(surf, self.cam)
-        for p in self.projectiles:
-            p.draw(surf, self.cam)
-        self.player.draw(surf, self.cam)
-
-        hud = font.render(f"Time: {int(self.elapsed)}s   Level: {self.player.level}   XP: {self.player.xp}/{self.player.xp_to_next}   Kills: {self.player.kills}   Enemies: {len(self.enemies)}", True, C_UI)
+    def draw(self, surf, alpha=1.0):
+        # alpha blends each entity from its previous to its current tick position
+        self.prof.start()
+        self.draw_snapshot(surf, self.render_snapshot(self.view), alpha)
+        self.prof.lap("draw")
+
+    def render_snapshot(self, snap=None):
+        # fills snap (a new one if None) from the current state, culled to the camera
+        if snap is None:
+            snap = RenderSnapshot()
+        pl = self.player
+        snap.tick_time = time.perf_counter()
+        snap.input_sampled = self.input_sampled
+        snap.pos = (pl.pos.x, pl.pos.y)
+        snap.prev = (pl.prev.x, pl.prev.y)
+        snap.radius = pl.radius
+        snap.hp_ratio = clamp(pl.hp / pl.max_hp, 0, 1)
+        snap.hud = (int(self.elapsed), pl.level, pl.xp, pl.xp_to_next, pl.kills, len(self.enemies))
+        snap.paused = self.paused
+        snap.show_levelup = self.show_levelup
+        snap.game_over = self.game_over
+        snap.levelup_options = self.levelup_options
+        snap.static = self.is_static()
+        bounds = self.view_bounds(self.cam)
+        if self.array_store:
+            self.snapshot_arrays(snap.layers, bounds)
+        else:
+            self.snapshot_objects(snap.layers, bounds)
+        if self.particles is not None:
+            self.particles.rows(snap.particles, bounds)
+        return snap
+
+    def snapshot_objects(self, layers, bounds):
+        x0, y0, x1, y1 = bounds
+        for rows, items in zip(layers, (self.xps, self.enemies, self.projectiles)):
+            rows.clear()
+            add = rows.append
+            enemies = items is self.enemies
+            for o in items:
+                if not o.active: continue
+                p = o.pos
+                if not (x0 <= p.x <= x1 and y0 <= p.y <= y1): continue
+                q = o.prev
+                add((p.x, p.y, q.x, q.y, o.radius, o.hp / o.max_hp if enemies else 1.0))
+
+    def snapshot_arrays(self, layers, bounds):
+        # same as snapshot_objects, with the culling and row building done on the arrays
+        x0, y0, x1, y1 = bounds
+        for rows, pool in zip(layers, (self.xp_pool, self.enemy_pool, self.projectile_pool)):
+            st = pool.store
+            pos = st.pos
+            idx = np.flatnonzero(st.active & (pos[:, 0] >= x0) & (pos[:, 0] <= x1)
+                                 & (pos[:, 1] >= y0) & (pos[:, 1] <= y1))
+            if pool is self.enemy_pool:
+                ratio = st.hp[idx] / st.max_hp[idx]
+            else:
+                ratio = np.ones(len(idx))
+            rows[:] = np.column_stack((pos[idx], st.prev[idx], st.radius[idx], ratio)).tolist()
+
+    def draw_snapshot(self, surf, snap, alpha=1.0):
+        # reads nothing but snap, the static walls and the render caches, so it can run on
+        # another thread than the one ticking the game
+        x, y = snap.pos
+        lerp = alpha < 1.0
+        if lerp:
+            px, py = snap.prev
+            x = px + (x - px) * alpha
+            y = py + (y - py) * alpha
+        cx, cy = x - SCREEN_W/2, y - SCREEN_H/2
+        if self.ground is None:
+            self.ground = GroundLayer(self.render_seed)
+            if np is not None:
+                self.particles = ParticleSystem(seed=self.render_seed)
+            self.ground.prefetch(cx, cy, cx + SCREEN_W, cy + SCREEN_H)
+        self.ground.draw(surf, cx, cy)
+        self.draw_obstacles(surf, cx, cy)
+
+        # one blits() batch per layer
+        circle = self.sprites.circle
+        bar = self.sprites.bar
+        for rows, color in zip(snap.layers, LAYER_COLORS):
+            seq = []
+            bars = []
+            for ex, ey, px, py, r, ratio in rows:
+                if lerp:
+                    ex = px + (ex - px) * alpha
+                    ey = py + (ey - py) * alpha
+                r = int(r)
+                sx, sy = ex - cx, ey - cy
+                seq.append((circle(r, color), (int(sx) - r, int(sy) - r)))
+                if ratio < 1:
+                    bars.append((bar(r, int(r * 2 * max(ratio, 0))), (int(sx - r), int(sy - r - 8))))
+            surf.blits(seq, False)
+            if bars:
+                surf.blits(bars, False)
+        if snap.particles:
+            dot = self.sprites.dot
+            surf.blits([(dot(int(size), C_PARTICLES[int(c)]), (int(px - cx - size / 2), int(py - cy - size / 2)))
+                        for px, py, size, c in snap.particles], False)
+        draw_player(surf, x - cx, y - cy, snap.radius, snap.hp_ratio)
+
+        text = self.texts.render
+        secs, level, xp, xp_to_next, kills, enemies = snap.hud
+        hud = text(font, f"Time: {secs}s   Level: {level}   XP: {xp}/{xp_to_next}   Kills: {kills}   Enemies: {enemies}", C_UI)
         surf.blit(hud, (12, 12))
 
-        hint = font.render("WASD move • Mouse aim (auto-shoot) • SHIFT sprint • P pause • R restart", True, (120,120,140))
+        hint = text(font, "WASD move • Mouse aim (auto-shoot) • SHIFT sprint • P pause • R restart • F5/F9 save/load", (120,120,140))
         surf.blit(hint, (12, SCREEN_H-26))
 
-        if self.show_levelup:
-            self.draw_levelup(surf)
+        if snap.show_levelup:
+            self.draw_levelup(surf, snap.levelup_options)
 
-        if self.paused and not self.show_levelup:
-            txt = bigfont.render("PAUSED", True, (220,220,220))
+        if snap.paused and not snap.show_levelup:
+            txt = text(bigfont, "PAUSED", (220,220,220))
             surf.blit(txt, (SCREEN_W//2 - txt.get_width()//2, SCREEN_H//2 - txt.get_height()//2))
 
-        if self.game_over:
-            txt = bigfont.render("YOU DIED - Press R to restart", True, (250,180,180))
+        if snap.game_over:
+            txt = text(bigfont, "YOU DIED - Press R to restart", (250,180,180))
             surf.blit(txt, (SCREEN_W//2 - txt.get_width()//2, SCREEN_H//2 - txt.get_height()//2))
 
-    def draw_levelup(self, surf):
+    def is_static(self):
+        return self.paused or self.show_levelup or self.game_over
+
+    def draw_static(self, surf):
+        # paused, level-up and death screens only change on input: draw them once and
+        # return the dirty rects for display.update(), or [] when nothing changed
+        key = (self.paused, self.show_levelup, self.game_over, id(self.levelup_options), self.show_profiler)
+        if key == self.static_key:
+            return []
+        self.static_key = key
+        self.draw(surf)
+        return [surf.get_rect()]
+
+    def view_bounds(self, cam):
+        cx, cy = cam.x, cam.y
+        return cx - CULL_MARGIN, cy - CULL_MARGIN, cx + SCREEN_W + CULL_MARGIN, cy + SCREEN_H + CULL_MARGIN
+
+    def draw_obstacles(self, surf, cx, cy):
+        view = pygame.Rect(int(cx), int(cy), SCREEN_W, SCREEN_H)
+        for r in self.field.obstacles:
+            if r.colliderect(view):
+                surf.fill(C_OBSTACLE, r.move(-view.x, -view.y))
+
+    def draw_levelup(self, surf, options):
+        # the panel is cached per options list, which open_levelup() replaces each time
         w = 640; h = 220
-        rect = pygame.Rect(SCREEN_W//2 - w//2, SCREEN_H//2 - h//2, w, h)
-        pygame.draw.rect(surf, (26,26,36), rect)
-        pygame.draw.rect(surf, (100,100,140), rect, 3)
+        panel = self.levelup_panel
+        if panel is None or panel[0] is not options:
+            panel = self.levelup_panel = (options, self.render_levelup(options, w, h))
+        surf.blit(panel[1], (SCREEN_W//2 - w//2, SCREEN_H//2 - h//2))
+
+    def render_levelup(self, options, w, h):
+        # built once per level-up and blitted as one surface while the menu is open
+        panel = pygame.Surface((w, h))
+        rect = panel.get_rect()
+        pygame.draw.rect(panel, (26,26,36), rect)
+        pygame.draw.rect(panel, (100,100,140), rect, 3)
         title = bigfont.render("LEVEL UP! Choose an upgrade", True, (220,220,220))
-        surf.blit(title, (rect.x + 18, rect.y + 12))
-        for i, (name, desc, func) in enumerate(self.levelup_options):
+        panel.blit(title, (rect.x + 18, rect.y + 12))
+        for i, (name, desc, func) in enumerate(options):
             x = rect.x + 24 + i * (w//3)
             y = rect.y + 72
             opt_rect = pygame.Rect(x, y, w//3 - 36, 110)
-            pygame.draw.rect(surf, (36,36,46), opt_rect)
-            pygame.draw.rect(surf, (80,80,110), opt_rect, 2)
+            pygame.draw.rect(panel, (36,36,46), opt_rect)
+            pygame.draw.rect(panel, (80,80,110), opt_rect, 2)
             t1 = font.render(f"{i+1}. {name}", True, (220,220,220))
             t2 = font.render(desc, True, (190,190,200))
-            surf.blit(t1, (opt_rect.x + 8, opt_rect.y + 8))
-            surf.blit(t2, (opt_rect.x + 8, opt_rect.y + 38))
+            panel.blit(t1, (opt_rect.x + 8, opt_rect.y + 8))
+            panel.blit(t2, (opt_rect.x + 8, opt_rect.y + 38))
             k = bigfont.render(str(i+1), True, (150,200,250))
-            surf.blit(k, (opt_rect.x + opt_rect.w - 42, opt_rect.y + 8))
+            panel.blit(k, (opt_rect.x + opt_rect.w - 42, opt_rect.y + 8))
+        if pygame.display.get_surface() is not None:
+            panel = panel.convert()
+        return panel
+
+    def counts(self):
+        return {"enemies": len(self.enemies), "far": self.far_enemies, "projectiles": len(self.projectiles),
+                "xps": len(self.xps), "enemy_free": len(self.enemy_pool.free), "projectile_free": len(self.projectile_pool.free),
+                "xp_free": len(self.xp_pool.free)}
+
+    def set_profiling(self, on):
+        if on and not self.prof.enabled:
+            self.prof = Profiler()
+        elif not on and self.prof.enabled:
+            self.prof = NullProfiler()
+
+    def export_profile(self, path=None):
+        if not self.prof.enabled:
+            return None
+        path = path or time.strftime("profile-%Y%m%d-%H%M%S.csv")
+        n = self.prof.export_csv(path)
+        print(f"wrote {n} frames to {path}")
+        return path
+
+    def draw_profiler(self, surf, prof=None, title=None):
+        # the overlay times itself into prof; --threaded passes the main thread's own and a
+        # title saying so, since the simulation thread's phases are not in it
+        prof = prof if prof is not None else self.prof
+        prof.start()
+        frames = list(prof.frames)[-PROFILE_GRAPH_FRAMES:]
+        budget = 1000.0 / FPS
+        gw, gh = PROFILE_GRAPH_FRAMES * 2, 120
+        scale = gh / (budget * 2)
+        head = 18 if title else 0
+        rect = pygame.Rect(SCREEN_W - gw - 12, 40 + head, gw, gh)
+        panel = pygame.Rect(rect.x, 40, gw, head + gh + 30 + 18 * len(PROFILE_COLORS))
+        pygame.draw.rect(surf, (10, 10, 16), panel)
+        if title:
+            surf.blit(font.render(title, True, C_UI), (rect.x, 40))
+        for i, (phases, counts) in enumerate(frames):
+            x = rect.x + i * 2
+            y = rect.bottom
+            for name, dt in phases.items():
+                h = dt * 1000.0 * scale
+                if h < 0.5:
+                    continue
+                top = max(rect.y, y - h)
+                pygame.draw.line(surf, PROFILE_COLORS.get(name, C_UI), (x, y), (x, top), 2)
+                y = top
+        ty = rect.bottom - int(budget * scale)
+        pygame.draw.line(surf, (240, 80, 80), (rect.x, ty), (rect.right, ty), 1)
+        pygame.draw.rect(surf, (80, 80, 110), rect, 1)
+
+        if frames:
+            n = len(frames)
+            avg = {}
+            for phases, counts in frames:
+                for name, dt in phases.items():
+                    avg[name] = avg.get(name, 0.0) + dt * 1000.0 / n
+            y = rect.bottom + 6
+            for name, ms in avg.items():
+                pygame.draw.rect(surf, PROFILE_COLORS.get(name, C_UI), (rect.x, y + 5, 8, 8))
+                surf.blit(font.render(f"{name:<12}{ms:6.2f} ms", True, C_UI), (rect.x + 14, y))
+                y += 18
+            counts = frames[-1][1]
+            surf.blit(font.render("  ".join(f"{k} {v}" for k, v in counts.items() if not k.endswith("_free")),
+                                  True, C_UI), (rect.x, y + 4))
+        prof.lap("overlay")
+        return panel
 
     def handle_event(self, ev):
+        if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.static_key = None
         if ev.type == pygame.KEYDOWN:
+            if ev.key == pygame.K_F3:
+                self.show_profiler = not self.show_profiler
+                self.set_profiling(self.show_profiler or self.keep_profiler)
+            if ev.key == pygame.K_F4:
+                self.export_profile()
+            if ev.key == pygame.K_F5:
+                self.quicksave = self.snapshot()
+                with open(QUICKSAVE_FILE, "wb") as f:
+                    f.write(self.quicksave)
+            if ev.key == pygame.K_F9:
+                # a restore can't be expressed in a recording, so it is off while recording
+                if self.recorder is None:
+                    if self.quicksave is None and os.path.exists(QUICKSAVE_FILE):
+                        with open(QUICKSAVE_FILE, "rb") as f:
+                            self.quicksave = f.read()
+                    if self.quicksave is not None:
+                        self.restore(self.quicksave)
             if ev.key == pygame.K_p:
                 if not self.game_over:
                     self.paused = not self.paused
             if ev.key == pygame.K_r:
                 # restart
+                if self.recorder is not None:
+                    self.recorder.record_reset()
                 self.reset()
-            if self.show_levelup:
-                if ev.key == pygame.K_1:
-                    self.apply_upgrade(0)
-                elif ev.key == pygame.K_2:
-                    self.apply_upgrade(1)
-                elif ev.key == pygame.K_3:
-                    self.apply_upgrade(2)
-
-def main():
-    game = Game()
+            if self.show_levelup and ev.key in (pygame.K_1, pygame.K_2, pygame.K_3):
+                index = ev.key - pygame.K_1
+                if self.recorder is not None and index < len(self.levelup_options):
+                    self.recorder.record_pick(index)
+                self.apply_upgrade(index)
+
+class LatestInput:
+    # --threaded input: the main thread stores a sample every frame, each tick reads the newest
+    def __init__(self, state=None):
+        self.state = state if state is not None else InputState()
+
+    def read(self, game):
+        return self.state
+
+class SnapshotBuffer:
+    # two RenderSnapshots: the simulation thread fills the back one and swaps it to the front,
+    # the main thread draws the front one between acquire() and release(). A publish that would
+    # overwrite the snapshot still being drawn is skipped rather than waited for
+    def __init__(self):
+        self.slots = [RenderSnapshot(), RenderSnapshot()]
+        self.front = 0
+        self.reading = None
+        self.version = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def publish(self, game):
+        back = 1 - self.front
+        with self.lock:
+            if self.reading == back:
+                self.skipped += 1
+                return False
+        snap = game.render_snapshot(self.slots[back])
+        with self.lock:
+            self.version += 1
+            snap.version = self.version
+            self.front = back
+        return True
+
+    def acquire(self):
+        with self.lock:
+            self.reading = self.front
+            return self.slots[self.front]
+
+    def release(self):
+        with self.lock:
+            self.reading = None
+
+class SimThread:
+    # runs Game.update at the tick rate on its own thread. Events and input samples come in
+    # from the main thread through send() and sample(); the main thread only ever reads the
+    # published snapshots, everything else in the Game belongs to this thread while it runs
+    def __init__(self, game, rate=TICK_RATE, max_substeps=MAX_SUBSTEPS):
+        self.game = game
+        self.stepper = FixedStep(rate, max_substeps)
+        self.buffer = SnapshotBuffer()
+        self.source = game.input
+        self.input = LatestInput()
+        self.events = deque()
+        self.stopping = False
+        # whatever Game.update raised; the worker stops and play_threaded() raises it again
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+
+    def start(self):
+        self.game.input = self.input
+        self.buffer.publish(self.game)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.thread.join()
+        self.game.input = self.source
+
+    def send(self, ev):
+        self.events.append(ev)
+
+    def sample(self):
+        self.input.state = self.source.read(self.game)
+
+    def run(self):
+        try:
+            self.loop()
+        except BaseException as e:
+            self.error = e
+
+    def loop(self):
+        game = self.game
+        stepper = self.stepper
+        dirty = False
+        last = time.perf_counter()
+        while not self.stopping:
+            now = time.perf_counter()
+            while self.events:
+                game.handle_event(self.events.popleft())
+                dirty = True
+            if game.is_static():
+                stepper.hold()
+            else:
+                n = stepper.advance(now - last)
+                for _ in range(n):
+                    game.update(stepper.dt, [])
+                    if game.is_static():
+                        break
+                if n:
+                    game.prof.end_frame(game.counts())
+                    dirty = True
+            last = now
+            if dirty:
+                dirty = not self.buffer.publish(game)
+            # sleep until the next tick is due
+            time.sleep(max(0.0005, stepper.dt - stepper.accum - (time.perf_counter() - now)))
+
+class FrameStats:
+    # per-frame figures for comparing the serial and --threaded loops: the interval between
+    # flips, the main thread's busy time per frame, and input latency from the moment input was
+    # sampled to the flip of the first frame showing a tick that used it
+    def __init__(self):
+        self.interval = []
+        self.busy = []
+        self.latency = []
+        self.last_flip = None
+        self.last_input = 0.0
+
+    def add(self, start, input_sampled):
+        now = time.perf_counter()
+        if self.last_flip is not None:
+            self.interval.append((now - self.last_flip) * 1000.0)
+        self.last_flip = now
+        self.busy.append((now - start) * 1000.0)
+        if input_sampled and input_sampled != self.last_input:
+            self.last_input = input_sampled
+            self.latency.append((now - input_sampled) * 1000.0)
+
+    def summary(self):
+        out = {}
+        for name, vals in (("frame interval", self.interval), ("main thread", self.busy),
+                           ("input latency", self.latency)):
+            vals = sorted(vals)
+            if vals:
+                out[name] = {q: vals[int(p * (len(vals) - 1))] for q, p in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))}
+                out[name]["max"] = vals[-1]
+        return out
+
+    def report(self):
+        return "\n".join(f"{name:<15} " + "  ".join(f"{q} {v:6.2f}" for q, v in st.items()) + " ms"
+                         for name, st in self.summary().items())
+
+def play(game, fps=FPS, rate=TICK_RATE, max_substeps=MAX_SUBSTEPS, frames=0, stats=None, first_frame=None):
+    # the serial loop: events, ticks, draw and flip one after another on this thread; stops
+    # on quit/Esc or after frames frames when frames > 0
     running = True
-    accum = 0.0
-
+    stepper = FixedStep(rate, max_substeps)
+    n = 0
     while running:
-        dt = clock.tick(FPS) / 1000.0
-        accum += dt
+        prof = game.prof
+        prof.start()
+        frame_dt = clock.tick(fps) / 1000.0
+        start = time.perf_counter()
+        prof.lap("wait")
         events = pygame.event.get()
         for ev in events:
             if ev.type == pygame.QUIT:
@@ -561,19 +3100,277 @@ def main():
                 if ev.key == pygame.K_ESCAPE:
                     running = False
             game.handle_event(ev)
+        prof.lap("events")
+        prof = game.prof
 
-        
-        keys = pygame.key.get_pressed()
-
+        alpha = 1.0
         if not game.paused and not game.show_levelup and not game.game_over:
-            
-            game.update(dt, events)
+            for _ in range(stepper.advance(frame_dt)):
+                game.update(stepper.dt, events)
+                events = []
+                if game.is_static():
+                    break
+            alpha = stepper.alpha()
+        else:
+            stepper.hold()
+
+        if game.is_static():
+            dirty = game.draw_static(screen)
+            if game.show_profiler:
+                dirty.append(game.draw_profiler(screen))
+            if dirty:
+                pygame.display.update(dirty)
+        else:
+            game.draw(screen, alpha)
+            if game.show_profiler:
+                game.draw_profiler(screen)
+            pygame.display.flip()
+        prof.lap("flip")
+        prof.end_frame(game.counts())
+        if stats is not None:
+            stats.add(start, game.input_sampled)
+        n += 1
+        if first_frame is not None and n == 1:
+            first_frame()
+        if frames and n >= frames:
+            running = False
+    return n
+
+def play_threaded(game, fps=FPS, rate=TICK_RATE, max_substeps=MAX_SUBSTEPS, frames=0, stats=None, first_frame=None):
+    # the pipelined loop: a SimThread ticks the game while this thread handles events, samples
+    # input and draws the newest snapshot, interpolated by the time since it was published.
+    # The sim thread's phases go to game.prof, this thread's to its own profiler
+    sim = SimThread(game, rate, max_substeps)
+    prof = NullProfiler()
+    sim.start()
+    running = True
+    drawn = None
+    n = 0
+    try:
+        while running:
+            if sim.error is not None:
+                raise sim.error
+            if prof.enabled != game.prof.enabled:
+                prof = Profiler() if game.prof.enabled else NullProfiler()
+            prof.start()
+            clock.tick(fps)
+            start = time.perf_counter()
+            prof.lap("wait")
+            for ev in pygame.event.get():
+                if ev.type == pygame.QUIT:
+                    running = False
+                if ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE:
+                    running = False
+                if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    drawn = None
+                sim.send(ev)
+            sim.sample()
+            prof.lap("events")
+
+            snap = sim.buffer.acquire()
+            overlay = game.show_profiler
+            # like draw_static(), a menu or death screen is drawn once until it changes
+            if not (snap.static and drawn == (snap.version, overlay)):
+                alpha = 1.0 if snap.static else clamp((start - snap.tick_time) * rate, 0.0, 1.0)
+                game.draw_snapshot(screen, snap, alpha)
+                prof.lap("draw")
+                if overlay:
+                    game.draw_profiler(screen, prof, "main thread (simulation: F4 CSV)")
+                pygame.display.flip()
+                drawn = (snap.version, overlay)
+            if stats is not None:
+                stats.add(start, snap.input_sampled)
+            sim.buffer.release()
+            prof.lap("flip")
+            prof.end_frame()
+            n += 1
+            if first_frame is not None and n == 1:
+                first_frame()
+            if frames and n >= frames:
+                running = False
+    finally:
+        sim.stop()
+    return n
+
+def run_headless(ticks, seed=None, array_store=False, input_source=None, dt=1.0 / FPS, obstacles=(), state=None,
+                 lod=True, spawn_data=None):
+    # no display, audio or assets; stops early if the player dies
+    game = Game(array_store=array_store, seed=seed,
+                input_source=input_source if input_source is not None else ScriptedInput(), obstacles=obstacles,
+                lod=lod, spawn_data=spawn_data)
+    if state is not None:
+        game.restore(state)
+    n = 0
+    t0 = time.perf_counter()
+    while n < ticks and not game.game_over:
+        game.update(dt, [])
+        n += 1
+    return game, n, time.perf_counter() - t0
+
+def run_replay(replay, render_every=0, prof=None):
+    # drives the same Game.update path as live play, as fast as it will go; with render_every=N
+    # every Nth tick is also drawn and flipped (init_display() first)
+    inp = ReplayInput()
+    game = Game(array_store=replay.array_store, seed=replay.seed, input_source=inp,
+                obstacles=scatter_obstacles(replay.obstacles, random.Random(replay.seed)), lod=replay.lod)
+    if prof is not None:
+        game.prof = prof
+    dt = 1.0 / replay.tick_rate
+    expected = None
+    n = 0
+    t0 = time.perf_counter()
+    for kind, value in replay.records():
+        if kind == "tick":
+            inp.state = value
+            game.update(dt, [])
+            n += 1
+            if render_every and n % render_every == 0:
+                game.draw(screen)
+                pygame.display.flip()
+            if prof is not None:
+                prof.end_frame(game.counts())
+        elif kind == "pick":
+            game.apply_upgrade(value)
+        elif kind == "reset":
+            game.reset()
+        else:
+            expected = value
+    return game, n, time.perf_counter() - t0, expected
 
-        game.draw(screen)
-        pygame.display.flip()
+def print_pool_stats(game):
+    for name, st in game.pool_stats().items():
+        print(f"{name:<12} size {st['size']:>5}  high water {st['high_water']:>5}  misses {st['misses']:>5}  "
+              f"allocs {st['allocs']:>5}  refused {st['refused']:>5}  recycled {st['recycled']:>5}  "
+              f"suggested initial size {st['suggested']}")
 
+def main():
+    ap = argparse.ArgumentParser(description="Zombie Rush")
+    ap.add_argument("--arrays", action="store_true", help="use the NumPy struct-of-arrays entity store")
+    ap.add_argument("--seed", type=int, help="seed the game RNG for a reproducible run")
+    ap.add_argument("--headless", action="store_true", help="simulate without a window and print a summary")
+    ap.add_argument("--ticks", type=int, default=FPS * 600, help="tick limit for --headless")
+    ap.add_argument("--tick-rate", type=int, default=TICK_RATE, help="simulation ticks per second (e.g. 30, 60, 120)")
+    ap.add_argument("--fps", type=int, default=FPS, help="render frame cap, independent of --tick-rate")
+    ap.add_argument("--max-substeps", type=int, default=MAX_SUBSTEPS, help="most ticks simulated per rendered frame")
+    ap.add_argument("--profile", action="store_true", help="record frame timings from the start (F3 overlay, F4 CSV)")
+    ap.add_argument("--profile-csv", metavar="PATH", help="write recorded frames to PATH on exit")
+    ap.add_argument("--pool-stats", action="store_true", help="print pool usage and suggested initial sizes on exit")
+    ap.add_argument("--obstacles", type=int, default=0, metavar="N", help="scatter N static walls for the horde to path around")
+    ap.add_argument("--startup-time", action="store_true", help="print how long startup took, by phase")
+    ap.add_argument("--record", metavar="PATH", help="record the session's input to PATH for --replay")
+    ap.add_argument("--replay", metavar="PATH", help="replay a --record file headless at full speed")
+    ap.add_argument("--render-every", type=int, default=0, metavar="N", help="with --replay, draw every Nth tick")
+    ap.add_argument("--load", metavar="PATH", help="start from a saved snapshot (F5 writes one to quicksave.zrs)")
+    ap.add_argument("--save", metavar="PATH", help="with --headless, write a snapshot of the final state")
+    ap.add_argument("--no-lod", action="store_true", help="simulate far enemies at full detail (see LOD_BANDS)")
+    ap.add_argument("--waves", metavar="PATH", help="load enemy types and waves from a JSON file (see load_spawn_data)")
+    ap.add_argument("--threaded", action="store_true",
+                    help="simulate on a worker thread while the main thread draws published snapshots")
+    ap.add_argument("--frame-stats", action="store_true", help="print frame time and input latency percentiles on exit")
+    args = ap.parse_args()
+    if args.tick_rate < 1:
+        ap.error("--tick-rate must be at least 1")
+    if args.obstacles < 0:
+        ap.error("--obstacles must not be negative")
+    if args.arrays and np is None:
+        print("numpy is not installed, using the object entity store")
+
+    if args.replay:
+        replay = Replay.load(args.replay)
+        if args.render_every:
+            init_display()
+        prof = Profiler() if args.profile or args.profile_csv else None
+        game, n, wall, expected = run_replay(replay, args.render_every, prof)
+        digest = game.digest()
+        check = "no recorded digest" if expected is None else "digest matches" if digest == expected else "DIGEST MISMATCH"
+        print(f"{n} ticks in {wall:.2f}s ({n / max(wall, 1e-9):.0f} ticks/s)  "
+              f"time {game.elapsed:.1f}s  kills {game.player.kills}  level {game.player.level}  {check}")
+        if args.profile_csv:
+            game.export_profile(args.profile_csv)
+        return 0 if expected in (None, digest) else 1
+
+    if args.record and args.headless:
+        ap.error("--record records a played session; --headless has no player input to record")
+    if args.record and args.seed is None:
+        args.seed = random.getrandbits(63)
+    if args.record and not 0 <= args.seed < 2**64:
+        ap.error("--record needs a --seed from 0 to 2**64 - 1, the range a replay header holds")
+    if args.record and (args.tick_rate > 0xFFFF or args.obstacles > 0xFFFF):
+        ap.error("--record needs --tick-rate and --obstacles of at most 65535, the range a replay header holds")
+    obstacles = scatter_obstacles(args.obstacles, random.Random(args.seed))
+    state = None
+    if args.load:
+        if args.record:
+            ap.error("--record starts from a seed, not from --load")
+        try:
+            with open(args.load, "rb") as f:
+                state = f.read()
+            check_snapshot(state)
+        except (OSError, ValueError) as e:
+            ap.error(f"--load {args.load}: {e}")
+    spawn_data = None
+    if args.waves:
+        if args.record:
+            ap.error("--record files replay with the built-in waves, not --waves")
+        try:
+            spawn_data = load_spawn_data(args.waves)
+        except (OSError, ValueError) as e:
+            ap.error(f"--waves: {e}")
+
+    if args.headless:
+        game, n, wall = run_headless(args.ticks, args.seed, args.arrays, dt=1.0 / args.tick_rate,
+                                     obstacles=obstacles, state=state, lod=not args.no_lod, spawn_data=spawn_data)
+        print(f"{n} ticks in {wall:.2f}s ({n / max(wall, 1e-9):.0f} ticks/s)  "
+              f"time {game.elapsed:.1f}s  kills {game.player.kills}  level {game.player.level}  "
+              f"digest {game.digest()}")
+        if args.pool_stats:
+            print_pool_stats(game)
+        if args.save:
+            with open(args.save, "wb") as f:
+                f.write(game.snapshot())
+        return
+
+    mark_startup("import", STARTUP_T0)
+    init_display()
+    t = time.perf_counter()
+    game = Game(array_store=args.arrays, seed=args.seed, obstacles=obstacles, lod=not args.no_lod,
+                spawn_data=spawn_data)
+    if state is not None:
+        game.restore(state)
+    game.keep_profiler = bool(args.profile or args.profile_csv)
+    game.set_profiling(game.keep_profiler)
+    if args.record:
+        game.recorder = InputRecorder(args.seed, args.tick_rate, game.array_store, args.obstacles, game.lod is not None)
+    t = mark_startup("game", t)
+
+    def first_frame():
+        mark_startup("first frame", t)
+        startup_times["total"] = (time.perf_counter() - STARTUP_T0) * 1000.0
+        if args.startup_time:
+            print("startup: " + ", ".join(f"{k} {v:.0f} ms" for k, v in startup_times.items()))
+
+    stats = FrameStats() if args.frame_stats else None
+    loop = play_threaded if args.threaded else play
+    try:
+        loop(game, args.fps, args.tick_rate, args.max_substeps, stats=stats, first_frame=first_frame)
+    except BaseException:
+        # keep the input up to and including the tick that raised, so the crash can be replayed
+        if args.record:
+            game.recorder.save(args.record)
+            print(f"recorded {game.recorder.ticks} ticks to {args.record} before the error")
+        raise
+    if stats is not None:
+        print(stats.report())
+
+    if args.profile_csv:
+        game.export_profile(args.profile_csv)
+    if args.pool_stats:
+        print_pool_stats(game)
+    if args.record:
+        game.recorder.save(args.record, game.digest())
+        print(f"recorded {game.recorder.ticks} ticks to {args.record}")
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())